@@ -0,0 +1,165 @@
+"""Benchmark the integration's miIO transport against simulated dispellers.
+
+For every fleet size the benchmark measures:
+
+* setup: handshake and miIO.info of all the devices at once
+* poll cycle: one batched get_properties per device, the request the
+  coordinator sends on every poll
+* command latency: one set_properties per device
+* failures and retries: requests that failed, and resent requests after
+  a timeout or an id error
+
+    python benchmarks/benchmark.py --counts 1 10 100 500 --latency 0.02
+
+Thresholds (--max-setup, --max-poll, --max-command, in seconds) turn the
+run into a regression gate: the exit status is 1 if any is exceeded.
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import sys
+import time
+
+from simulator import async_start_fleet, protocol
+
+
+def load_const():
+    """Load the integration's constants without Home Assistant."""
+    path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..", "custom_components", "dakuo_mosquito_dispeller", "const.py"
+    )
+    spec = importlib.util.spec_from_file_location("dakuo_const", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+const = load_const()
+
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+async def _timed(coro):
+    start = time.monotonic()
+    try:
+        await coro
+    except protocol.DeviceException:
+        return None
+    return time.monotonic() - start
+
+
+async def async_run(count, args):
+    """Benchmark a fleet of count devices and return the results."""
+    fleet = await async_start_fleet(
+        count, latency=args.latency, loss=args.loss)
+    devices = [
+        protocol.MiioDevice(
+            host, device.token, timeout=args.timeout, port=port)
+        for host, port, device in fleet
+    ]
+    # the first poll of the coordinator, which also reads the did
+    properties = [*const.MIOT_PROPERTIES.values(), const.MIOT_DID]
+    poll = [
+        {"piid": piid, "siid": siid, "did": "None"}
+        for siid, piid in properties
+    ]
+    siid, piid = const.MIOT_PROPERTIES[const.PROPERTY_MODE]
+    write = [{"piid": piid, "siid": siid, "did": "None", "value": 1}]
+
+    try:
+        start = time.monotonic()
+        setup = await asyncio.gather(
+            *[_timed(device.async_info()) for device in devices])
+        setup_time = time.monotonic() - start
+
+        cycles = []
+        for _ in range(args.cycles):
+            start = time.monotonic()
+            await asyncio.gather(*[
+                _timed(device.async_send("get_properties", poll))
+                for device in devices])
+            cycles.append(time.monotonic() - start)
+
+        commands = await asyncio.gather(*[
+            _timed(device.async_send("set_properties", write))
+            for device in devices])
+    finally:
+        for device in devices:
+            device.close()
+        for _, _, simulated in fleet:
+            simulated.close()
+
+    latencies = [latency for latency in commands if latency is not None]
+    return {
+        "devices": count,
+        "setup": setup_time,
+        "offline": setup.count(None),
+        "poll": sum(cycles) / len(cycles),
+        "command_p50": _percentile(latencies, 50),
+        "command_p95": _percentile(latencies, 95),
+        "failures": sum(device.stats.failures for device in devices),
+        "retries": sum(
+            stats.retries
+            for device in devices
+            for stats in device.stats.commands.values()),
+    }
+
+
+def _ms(value):
+    return "-" if value is None else "{:.1f}".format(value * 1000)
+
+
+async def async_main(args):
+    """Run the benchmark for every fleet size and report the results."""
+    print("{:>7} {:>10} {:>8} {:>10} {:>10} {:>10} {:>9} {:>8}".format(
+        "devices", "setup ms", "offline", "poll ms", "cmd p50",
+        "cmd p95", "failures", "retries"))
+
+    failed = False
+    for count in args.counts:
+        result = await async_run(count, args)
+        print("{:>7} {:>10} {:>8} {:>10} {:>10} {:>10} {:>9} {:>8}".format(
+            result["devices"], _ms(result["setup"]), result["offline"],
+            _ms(result["poll"]), _ms(result["command_p50"]),
+            _ms(result["command_p95"]), result["failures"],
+            result["retries"]))
+
+        for key, limit in (("setup", args.max_setup),
+                           ("poll", args.max_poll),
+                           ("command_p95", args.max_command)):
+            if limit is not None and (
+                    result[key] is None or result[key] > limit):
+                print("{} devices: {} exceeds {} s".format(count, key, limit))
+                failed = True
+
+    return 1 if failed else 0
+
+
+def main():
+    """Parse the arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", type=int, nargs="+",
+                        default=[1, 10, 100, 500])
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="simulated reply delay in seconds")
+    parser.add_argument("--loss", type=float, default=0.0,
+                        help="probability to drop a packet")
+    parser.add_argument("--timeout", type=float, default=2.0,
+                        help="request timeout in seconds")
+    parser.add_argument("--cycles", type=int, default=5,
+                        help="poll cycles to average")
+    parser.add_argument("--max-setup", type=float)
+    parser.add_argument("--max-poll", type=float)
+    parser.add_argument("--max-command", type=float)
+    sys.exit(asyncio.run(async_main(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
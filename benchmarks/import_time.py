@@ -0,0 +1,73 @@
+"""Compare the import time of the integration's miIO core and python-miio.
+
+Each module is imported in a fresh interpreter, several times, and the
+median is reported with the heavy modules the import pulled in:
+
+    python benchmarks/import_time.py --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from simulator import PROTOCOL_PATH
+
+HEAVY_MODULES = ("cryptography", "click", "miio")
+
+MEASURE = """
+import importlib.util, json, sys, time
+start = time.perf_counter()
+{}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "elapsed": elapsed,
+    "modules": [name for name in {!r} if name in sys.modules]
+}}))
+"""
+
+IMPORTS = {
+    "protocol": (
+        "spec = importlib.util.spec_from_file_location("
+        "'dakuo_protocol', {!r})\n"
+        "spec.loader.exec_module(importlib.util.module_from_spec(spec))"
+    ).format(PROTOCOL_PATH),
+    "python-miio": "import miio",
+}
+
+
+def measure(code, runs):
+    """Return the median import time and the heavy modules loaded."""
+    script = MEASURE.format(code, HEAVY_MODULES)
+    times = []
+    modules = []
+    for _ in range(runs):
+        process = subprocess.run(
+            [sys.executable, "-c", script],
+            capture_output=True, text=True, check=False)
+        if process.returncode:
+            return None, process.stderr.strip().splitlines()[-1]
+        result = json.loads(process.stdout)
+        times.append(result["elapsed"])
+        modules = result["modules"]
+    return statistics.median(times), ", ".join(modules) or "-"
+
+
+def main():
+    """Measure the imports and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5,
+                        help="fresh interpreters per module")
+    args = parser.parse_args()
+
+    print("{:<12} {:>10}  {}".format("module", "median ms", "loaded"))
+    for name, code in IMPORTS.items():
+        elapsed, modules = measure(code, args.runs)
+        print("{:<12} {:>10}  {}".format(
+            name,
+            "-" if elapsed is None else "{:.1f}".format(elapsed * 1000),
+            modules))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Simulated Dakuo Mosquito Dispeller speaking the miIO protocol.
+
+Each simulated device listens on its own UDP port of 127.0.0.1 and emulates
+the MIoT properties read and written by the integration (did, liquid level,
+power and mode), with configurable latency, packet loss and offline periods.
+
+Run standalone to serve a fleet for a Home Assistant test instance; each
+device gets its own loopback address (127.1.0.1, 127.1.0.2, ...) on the miIO
+port, so it can be added with the normal config flow:
+
+    python benchmarks/simulator.py --count 10
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import random
+import time
+
+PROTOCOL_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..", "custom_components", "dakuo_mosquito_dispeller", "protocol.py"
+)
+
+
+def load_protocol():
+    """Load the integration's protocol module without Home Assistant."""
+    spec = importlib.util.spec_from_file_location(
+        "dakuo_protocol", PROTOCOL_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+protocol = load_protocol()
+
+ERROR_NOT_FOUND = -4003
+# liquid percent used per hour while the device is on
+LIQUID_RATE = 1.0
+
+
+class SimulatedDispeller(asyncio.DatagramProtocol):
+    # pylint: disable=too-many-instance-attributes
+    """One simulated dispeller."""
+
+    def __init__(self, device_id, token=None, latency=0.0, loss=0.0,
+                 offline=(), speedup=1.0):
+        # pylint: disable=too-many-arguments
+        """Initialize the device.
+
+        offline is a list of (start, end) seconds, relative to the start of
+        the device, during which every packet is dropped. speedup makes the
+        liquid drain faster than in real time.
+        """
+        self.device_id = device_id
+        self.token = token or os.urandom(16).hex()
+        self.latency = latency
+        self.loss = loss
+        self.offline = offline
+        self.speedup = speedup
+        self.requests = 0
+        self._token = bytes.fromhex(self.token)
+        self._transport = None
+        self._started = time.monotonic()
+        self._liquid = 100.0
+        self._liquid_time = self._started
+        self.properties = {
+            (1, 3): str(device_id),
+            (6, 1): True,
+            (6, 2): 0,
+        }
+
+    def connection_made(self, transport):
+        """Keep the transport to answer the requests."""
+        self._transport = transport
+
+    def close(self):
+        """Stop listening."""
+        if self._transport is not None:
+            self._transport.close()
+
+    def is_offline(self):
+        """Return true during an offline period."""
+        elapsed = time.monotonic() - self._started
+        return any(start <= elapsed < end for start, end in self.offline)
+
+    def datagram_received(self, data, addr):
+        """Answer a packet after the configured latency."""
+        if self.is_offline() or random.random() < self.loss:
+            return
+
+        reply = self._handle(data)
+        if reply is None:
+            return
+        if self.latency:
+            asyncio.get_running_loop().call_later(
+                self.latency, self._transport.sendto, reply, addr)
+        else:
+            self._transport.sendto(reply, addr)
+
+    def _stamp(self):
+        return int(time.monotonic() - self._started) + 1000
+
+    def _handle(self, data):
+        if data == protocol.HELLO:
+            return protocol.HEADER.pack(
+                protocol.MAGIC, protocol.HEADER_LENGTH, 0,
+                self.device_id, self._stamp()) + b"\xff" * 16
+
+        try:
+            _, _, request = protocol.parse_packet(self._token, data)
+        except ValueError:
+            return None
+
+        self.requests += 1
+        method = request.get("method")
+        params = request.get("params") or []
+        if method == "miIO.info":
+            result = {
+                "model": "dakuo.mosq.sim",
+                "fw_ver": "1.0.0",
+                "hw_ver": "ESP32",
+                "mac": "02:00:00:{:02X}:{:02X}:{:02X}".format(
+                    (self.device_id >> 16) & 0xFF,
+                    (self.device_id >> 8) & 0xFF,
+                    self.device_id & 0xFF),
+                "uid": self.device_id,
+            }
+        elif method == "get_properties":
+            result = [self._get(item) for item in params]
+        elif method == "set_properties":
+            result = [self._set(item) for item in params]
+        else:
+            response = {"error": {"code": -1, "message": "unknown method"}}
+            return self._packet(request, response)
+
+        return self._packet(request, {"result": result})
+
+    def _packet(self, request, response):
+        response["id"] = request.get("id")
+        return protocol.build_packet(
+            self._token, self.device_id, self._stamp(), response)
+
+    def _drain(self):
+        now = time.monotonic()
+        if self.properties[(6, 1)]:
+            hours = (now - self._liquid_time) * self.speedup / 3600
+            self._liquid = max(self._liquid - hours * LIQUID_RATE, 0.0)
+        self._liquid_time = now
+
+    def _get(self, item):
+        key = (item.get("siid"), item.get("piid"))
+        result = {**item, "code": 0}
+        if key == (5, 1):
+            self._drain()
+            if self._liquid <= 0:
+                result["code"] = ERROR_NOT_FOUND
+            else:
+                result["value"] = int(self._liquid)
+        elif key in self.properties:
+            result["value"] = self.properties[key]
+        else:
+            result["code"] = ERROR_NOT_FOUND
+        return result
+
+    def _set(self, item):
+        key = (item.get("siid"), item.get("piid"))
+        result = {name: value for name, value in item.items()
+                  if name != "value"}
+        if key in ((6, 1), (6, 2)):
+            self._drain()
+            value = item.get("value")
+            self.properties[key] = bool(value) if key == (6, 1) else value
+            result["code"] = 0
+        else:
+            result["code"] = ERROR_NOT_FOUND
+        return result
+
+
+def fleet_address(index):
+    """Return the loopback address of the index-th standalone device."""
+    return "127.1.{}.{}".format(index // 250, index % 250 + 1)
+
+
+async def async_start_fleet(count, standalone=False, **kwargs):
+    """Start count simulated devices and return (host, port, device).
+
+    The devices share 127.0.0.1 with one random port each, or use their own
+    loopback address and the miIO port when standalone.
+    """
+    loop = asyncio.get_running_loop()
+    fleet = []
+    for index in range(count):
+        device = SimulatedDispeller(index + 1, **kwargs)
+        if standalone:
+            local_addr = (fleet_address(index), protocol.MIIO_PORT)
+        else:
+            local_addr = ("127.0.0.1", 0)
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda device=device: device, local_addr=local_addr)
+        host, port = transport.get_extra_info("sockname")[:2]
+        fleet.append((host, port, device))
+    return fleet
+
+
+async def _async_main(args):
+    fleet = await async_start_fleet(
+        args.count,
+        standalone=True,
+        latency=args.latency,
+        loss=args.loss,
+        speedup=args.speedup
+    )
+    for host, _, device in fleet:
+        print("{} token {}".format(host, device.token))
+    await asyncio.Event().wait()
+
+
+def main():
+    """Serve a simulated fleet until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="reply delay in seconds")
+    parser.add_argument("--loss", type=float, default=0.0,
+                        help="probability to drop a packet")
+    parser.add_argument("--speedup", type=float, default=1.0,
+                        help="liquid drain speed factor")
+    try:
+        asyncio.run(_async_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,268 @@
 """Dakuo Mosquito Dispeller integration."""
 
+import asyncio
+import logging
+from datetime import timedelta
+
+import voluptuous as vol
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_HOST, CONF_SCAN_INTERVAL, CONF_TOKEN
 from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import ConfigEntryNotReady
+import homeassistant.helpers.config_validation as cv
 from .const import (
+    CONF_DEVICE_INFO,
+    CONF_RECORD,
+    CONF_REPLAY,
+    CONF_SCHEDULE,
+    CONF_SETUP_CONCURRENCY,
+    CONF_SETUP_TIMEOUT,
+    DEFAULT_SCAN_INTERVAL,
+    DEVICE_INFO_KEYS,
+    DEFAULT_SETUP_CONCURRENCY,
+    DEFAULT_SETUP_TIMEOUT,
     DOMAIN,
-    DOMAINS
+    DOMAINS,
+    MOSQUITO_DISPELLER_LIQUID,
+    MOSQUITO_DISPELLER_SCHEDULE,
+    MOSQUITO_DISPELLER_SETUP,
+    PROPERTY_DID
+)
+from .coordinator import MosquitoDispellerCoordinator
+from .liquid import LiquidHistory
+from .models import get_profile
+from .protocol import DeviceException, DeviceInfo, MiioDevice
+from .replay import RecordingDevice, ReplayDevice, recording_path
+from .runtime import MosquitoDispellerRuntime, RuntimeRegistry
+from .schedule import ScheduleEngine, parse_schedule
+from .services import async_setup_services
+
+_LOGGER = logging.getLogger(__name__)
+
+DOMAIN_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_SETUP_CONCURRENCY,
+                     default=DEFAULT_SETUP_CONCURRENCY): cv.positive_int,
+        vol.Optional(CONF_SETUP_TIMEOUT,
+                     default=DEFAULT_SETUP_TIMEOUT): cv.positive_int,
+        vol.Exclusive(CONF_RECORD, "transport"): cv.string,
+        vol.Exclusive(CONF_REPLAY, "transport"): cv.isdir,
+    }
+)
+
+CONFIG_SCHEMA = vol.Schema(
+    {DOMAIN: DOMAIN_SCHEMA}, extra=vol.ALLOW_EXTRA
 )
 
 
 async def async_setup(hass: HomeAssistant, hass_config: dict):
     """Set up the Dakuo Mosquito Dispeller component."""
 
+    conf = hass_config.get(DOMAIN) or DOMAIN_SCHEMA({})
+
+    # bound the number of devices doing their handshake at the same time
+    hass.data[MOSQUITO_DISPELLER_SETUP] = {
+        CONF_SETUP_CONCURRENCY: asyncio.Semaphore(
+            conf[CONF_SETUP_CONCURRENCY]),
+        CONF_SETUP_TIMEOUT: conf[CONF_SETUP_TIMEOUT],
+        CONF_RECORD: conf.get(CONF_RECORD),
+        CONF_REPLAY: conf.get(CONF_REPLAY)
+    }
+
+    liquid = LiquidHistory(hass)
+    await liquid.async_load()
+    hass.data[MOSQUITO_DISPELLER_LIQUID] = liquid
+
+    hass.data[DOMAIN] = RuntimeRegistry()
+    hass.data[MOSQUITO_DISPELLER_SCHEDULE] = ScheduleEngine(hass)
+
+    await async_setup_services(hass)
+
     return True
 
 
+def _device_info_cache(device_info, did):
+    """Return the device info fields stored in the config entry."""
+    cache = {key: device_info.raw.get(key) for key in DEVICE_INFO_KEYS}
+    cache[PROPERTY_DID] = did
+    return cache
+
+
+async def _async_create_device(hass: HomeAssistant, host: str, token: str):
+    """Return the client of a device, recording or replaying if enabled."""
+    setup = hass.data[MOSQUITO_DISPELLER_SETUP]
+    if setup[CONF_REPLAY]:
+        _LOGGER.warning("Replaying the recorded traffic of %s", host)
+        return await ReplayDevice.async_load(
+            hass, host, token, recording_path(setup[CONF_REPLAY], host))
+    if setup[CONF_RECORD]:
+        return RecordingDevice(
+            hass, host, token, recording_path(setup[CONF_RECORD], host))
+    return MiioDevice(host, token)
+
+
+async def _async_connect(hass: HomeAssistant, device: MiioDevice,
+                         entry: ConfigEntry):
+    """Fetch the device info and create the coordinator of a device.
+
+    Devices without cached info raise ConfigEntryNotReady when offline so
+    Home Assistant retries them in the background; devices with cached
+    info are set up as unavailable instead.
+    """
+    setup = hass.data[MOSQUITO_DISPELLER_SETUP]
+    cache = entry.data.get(CONF_DEVICE_INFO)
+
+    async with setup[CONF_SETUP_CONCURRENCY]:
+        if cache:
+            device_info = DeviceInfo(cache)
+            did = cache.get(PROPERTY_DID)
+        else:
+            try:
+                device_info = await asyncio.wait_for(
+                    device.async_info(), setup[CONF_SETUP_TIMEOUT])
+            except (asyncio.TimeoutError, DeviceException) as ex:
+                raise ConfigEntryNotReady(
+                    "Unable to connect to {}".format(device.host)) from ex
+            did = device_info.raw.get('uid')
+    _LOGGER.info(
+        "%s %s %s detected",
+        device_info.model,
+        device_info.firmware_version,
+        device_info.hardware_version,
+    )
+
+    scan_interval = entry.options.get(CONF_SCAN_INTERVAL)
+    coordinator = MosquitoDispellerCoordinator(
+        hass,
+        device,
+        entry.title,
+        did,
+        timedelta(seconds=scan_interval) if scan_interval
+        else DEFAULT_SCAN_INTERVAL,
+        hass.data[MOSQUITO_DISPELLER_LIQUID].tracker(entry.entry_id),
+        get_profile(device_info.model)
+    )
+
+    return device_info, coordinator
+
+
+async def _async_refresh_device_info(hass: HomeAssistant, entry: ConfigEntry,
+                                     device: MiioDevice, cache: dict):
+    """Check the cached device info and reload the entry on mismatch."""
+    try:
+        device_info = await device.async_info()
+    except DeviceException as ex:
+        _LOGGER.debug("Keeping cached info of %s: %s", device.host, ex)
+        return
+
+    did = cache.get(PROPERTY_DID)
+    if device_info.raw.get('uid') != cache.get('uid'):
+        did = device_info.raw.get('uid')
+    refreshed = _device_info_cache(device_info, did)
+    if refreshed == cache:
+        return
+
+    _LOGGER.info("Device info of %s changed, reloading", device.host)
+    hass.config_entries.async_update_entry(
+        entry, data={**entry.data, CONF_DEVICE_INFO: refreshed})
+    # not a task of the entry, the unload would cancel or wait for it
+    hass.async_create_task(hass.config_entries.async_reload(entry.entry_id))
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry):
+    """Forget the liquid history of a removed device."""
+    hass.data[MOSQUITO_DISPELLER_LIQUID].async_remove(entry.entry_id)
+
+
 async def async_update_options(hass: HomeAssistant, entry: ConfigEntry):
     """ Update Optioins if available """
+    runtime = hass.data[DOMAIN].get(entry.entry_id)
+    if runtime is not None and runtime.options == entry.options:
+        # only the cached device info was updated
+        return
     await hass.config_entries.async_reload(entry.entry_id)
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Support Dakuo Mosquito Dispeller."""
 
-    hass.data.setdefault(DOMAIN, {})
-
     # migrate data (also after first setup) to options
-    if entry.data:
-        hass.config_entries.async_update_entry(entry, data={},
-                                               options=entry.data)
+    if CONF_HOST in entry.data:
+        options = dict(entry.data)
+        data = {}
+        if CONF_DEVICE_INFO in options:
+            data[CONF_DEVICE_INFO] = options.pop(CONF_DEVICE_INFO)
+        hass.config_entries.async_update_entry(entry, data=data,
+                                               options=options)
+
+    host = entry.options[CONF_HOST]
+    token = entry.options[CONF_TOKEN]
+
+    _LOGGER.info("Initializing with host %s (token %s...)", host, token[:5])
+
+    # one device handle and handshake per device, shared by all platforms
+    device = await _async_create_device(hass, host, token)
+    try:
+        device_info, coordinator = await _async_connect(hass, device, entry)
+    except ConfigEntryNotReady:
+        device.close()
+        raise
+    hass.data[DOMAIN].add(MosquitoDispellerRuntime(
+        entry.entry_id,
+        device,
+        device_info,
+        coordinator,
+        dict(entry.options)
+    ))
+
+    cache = entry.data.get(CONF_DEVICE_INFO)
+    if not cache:
+        hass.config_entries.async_update_entry(entry, data={
+            **entry.data,
+            CONF_DEVICE_INFO: _device_info_cache(
+                device_info, coordinator.did)
+        })
+
+    schedule = entry.options.get(CONF_SCHEDULE)
+    if schedule:
+        try:
+            hass.data[MOSQUITO_DISPELLER_SCHEDULE].async_set(
+                entry.entry_id,
+                coordinator,
+                parse_schedule(schedule, coordinator.profile.preset_modes)
+            )
+        except vol.Invalid as ex:
+            _LOGGER.warning("Ignoring the schedule of %s: %s", host, ex)
 
     # add update handler
-    if not entry.update_listeners:
-        entry.add_update_listener(async_update_options)
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
 
     # init setup for each supported domains
     await hass.config_entries.async_forward_entry_setups(entry, DOMAINS)
 
+    if cache:
+        # checked once the entry is set up, a mismatch reloads it
+        entry.async_create_background_task(
+            hass, _async_refresh_device_info(hass, entry, device, cache),
+            "{} device info refresh".format(DOMAIN))
+
+    # the entities exist already, they get their state from the first poll;
+    # a background task, cancelled instead of awaited if the entry unloads
+    entry.async_create_background_task(
+        hass, coordinator.async_refresh(),
+        "{} first refresh".format(DOMAIN))
+
     return True
+
+
+async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
+    """Unload a config entry and release its device."""
+    unload_ok = await hass.config_entries.async_unload_platforms(
+        entry, DOMAINS)
+    if unload_ok:
+        hass.data[MOSQUITO_DISPELLER_SCHEDULE].async_remove(entry.entry_id)
+        runtime = hass.data[DOMAIN].remove(entry.entry_id)
+        await runtime.coordinator.async_shutdown()
+        runtime.device.close()
+
+    return unload_ok
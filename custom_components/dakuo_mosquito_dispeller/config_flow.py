@@ -1,27 +1,53 @@
 """Config flow to configure Dakuo Mosquito Dispeller component."""
+import asyncio
 import logging
 from collections import OrderedDict
 from typing import Optional
 
 import voluptuous as vol
 from homeassistant.config_entries import (
-    CONN_CLASS_LOCAL_PUSH,
+    CONN_CLASS_LOCAL_POLL,
     SOURCE_IMPORT,
     ConfigFlow,
     OptionsFlow,
     ConfigEntry
     )
-from homeassistant.const import CONF_NAME, CONF_HOST, CONF_TOKEN
+from homeassistant.const import (
+    CONF_NAME,
+    CONF_HOST,
+    CONF_SCAN_INTERVAL,
+    CONF_TOKEN
+)
 from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.selector import (
+    TextSelector,
+    TextSelectorConfig
+)
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.util.network import is_ip_address
 from homeassistant.exceptions import PlatformNotReady
 
-from miio import Device, DeviceException
-from .const import DOMAIN, DEFAULT_NAME
+from .const import (
+    CONF_DEVICE_INFO,
+    CONF_SCHEDULE,
+    CONF_TOKEN_FILE,
+    CONF_TOKENS,
+    DEFAULT_NAME,
+    DEFAULT_SCAN_INTERVAL,
+    DEVICE_INFO_KEYS,
+    DISCOVERY_CONCURRENCY,
+    DOMAIN,
+    PROPERTY_DID
+)
+from .models import get_profile
+from .protocol import DeviceException, MiioDevice, async_discover
+from .schedule import parse_schedule
 
 _LOGGER = logging.getLogger(__name__)
 
+# validated device info passed from the bulk step to the import flows
+IMPORT_INFO = "info"
+
 
 async def async_setup_platform(hass,
                                config,
@@ -47,37 +73,83 @@ async def validate_input(hass: HomeAssistant, data):
     Data has the keys from DATA_SCHEMA with values provided by the user.
     """
     try:
-        miio_device = Device(data[CONF_HOST], data[CONF_TOKEN])
-        device_info = miio_device.info()
-
-        if device_info.model:
-            model = device_info.model
-        _LOGGER.info(
-            "%s %s %s detected",
-            model,
-            device_info.firmware_version,
-            device_info.hardware_version,
-        )
+        miio_device = MiioDevice(data[CONF_HOST], data[CONF_TOKEN])
+    except ValueError as ex:
+        raise PlatformNotReady from ex
+    try:
+        device_info = await miio_device.async_info()
+    except DeviceException as ex:
+        raise PlatformNotReady from ex
+    finally:
+        miio_device.close()
+
+    _LOGGER.info(
+        "%s %s %s detected",
+        device_info.model,
+        device_info.firmware_version,
+        device_info.hardware_version,
+    )
+    cache = {key: device_info.raw.get(key) for key in DEVICE_INFO_KEYS}
+    cache[PROPERTY_DID] = device_info.raw.get('uid')
 
-    except DeviceException:
-        raise PlatformNotReady
     # Return info that you want to store in the config entry.
     return {
         "title": f"{DEFAULT_NAME}",
         "mac": f"{device_info.mac_address}",
+        CONF_DEVICE_INFO: cache,
     }
 
 
+def _read_token_file(path):
+    """Return the content of a token file."""
+    with open(path, encoding="utf-8") as token_file:
+        return token_file.read()
+
+
+def _parse_tokens(text, discovered):
+    """Return {host: token} of the "host token" lines of the text.
+
+    A device id from the discovery can be used instead of the host, lines
+    without a token and comments are skipped.
+    """
+    hosts = {str(device_id): host for host, device_id in discovered.items()}
+    devices = {}
+    for line in text.splitlines():
+        fields = line.replace(",", " ").split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        if len(fields) == 1 and (
+                is_ip_address(fields[0]) or fields[0] in hosts):
+            continue
+
+        if len(fields) != 2 or len(fields[1]) != 32:
+            raise vol.Invalid("Invalid line: {}".format(line))
+        host, token = fields
+        try:
+            bytes.fromhex(token)
+        except ValueError as ex:
+            raise vol.Invalid("Invalid token: {}".format(line)) from ex
+        if not is_ip_address(host):
+            if host not in hosts:
+                raise vol.Invalid("Unknown device: {}".format(line))
+            host = hosts[host]
+        devices[host] = token
+
+    return devices
+
+
 class MosquitoDispellerFlowHandler(ConfigFlow, domain=DOMAIN):
     """Handle a Dakuo Mosquito Dispeller config flow."""
 
     VERSION = 1
-    CONNECTION_CLASS = CONN_CLASS_LOCAL_PUSH
+    CONNECTION_CLASS = CONN_CLASS_LOCAL_POLL
 
     def __init__(self):
         """Initialize flow."""
         self._host: Optional[str] = None
         self._token: Optional[str] = None
+        self._device_info: Optional[dict] = None
+        self._discovered: Optional[dict] = None
 
     @staticmethod
     @callback
@@ -91,17 +163,41 @@ class MosquitoDispellerFlowHandler(ConfigFlow, domain=DOMAIN):
         error: Optional[str] = None
     ):  # pylint: disable=arguments-differ
         """Handle a flow initialized by the user."""
+        if user_input is not None:
+            return await self.async_step_manual(user_input, error)
+
+        return self.async_show_menu(
+            step_id="user",
+            menu_options=["manual", "bulk"]
+        )
+
+    async def async_step_import(self, user_input: ConfigType):
+        """Handle a device imported from YAML or added in bulk."""
+        self._set_user_input(user_input)
+        if not is_ip_address(self._host):
+            return self.async_abort(reason="connection_error")
+
+        info = user_input.get(IMPORT_INFO)
+        if info is None:
+            try:
+                info = await validate_input(self.hass, user_input)
+            except PlatformNotReady:
+                return self.async_abort(reason="connection_error")
+        return await self._async_add_device(info)
+
+    async def async_step_manual(
+        self,
+        user_input: Optional[ConfigType] = None,
+        error: Optional[str] = None
+    ):
+        """Handle a device entered by the user."""
         if user_input is not None:
             self._set_user_input(user_input)
             if not is_ip_address(self._host):
                 return self.async_abort(reason="connection_error")
 
             info = await validate_input(self.hass, user_input)
-            # prevent setting up the same account twice
-            await self.async_set_unique_id(info["mac"])
-            self._abort_if_unique_id_configured()
-            self._name = info["title"]
-            return self._async_get_entry()
+            return await self._async_add_device(info)
 
         fields = OrderedDict()
         fields[vol.Required(CONF_HOST,
@@ -110,11 +206,133 @@ class MosquitoDispellerFlowHandler(ConfigFlow, domain=DOMAIN):
                             default=self._token or vol.UNDEFINED)] = str
 
         return self.async_show_form(
-            step_id="user",
+            step_id="manual",
             data_schema=vol.Schema(fields),
             errors={'base': error} if error else None
         )
 
+    async def async_step_bulk(self, user_input: Optional[ConfigType] = None):
+        """Add many devices from pasted tokens or a token file."""
+        if self._discovered is None:
+            self._discovered = await self._async_discover()
+
+        errors = {}
+        if user_input is not None:
+            text = user_input.get(CONF_TOKENS, "")
+            path = user_input.get(CONF_TOKEN_FILE)
+            if path:
+                try:
+                    text += "\n" + await self.hass.async_add_executor_job(
+                        _read_token_file, path)
+                except OSError as ex:
+                    _LOGGER.warning("Unable to read %s: %s", path, ex)
+                    errors[CONF_TOKEN_FILE] = "token_file_error"
+
+            if not errors:
+                try:
+                    devices = _parse_tokens(text, self._discovered)
+                except vol.Invalid as ex:
+                    _LOGGER.warning("Invalid tokens: %s", ex)
+                    errors[CONF_TOKENS] = "invalid_tokens"
+                else:
+                    if devices:
+                        return await self._async_add_devices(devices)
+                    errors["base"] = "no_devices"
+        else:
+            user_input = {
+                CONF_TOKENS: "".join(
+                    "{} \n".format(host) for host in sorted(self._discovered))
+            }
+
+        return self.async_show_form(
+            step_id="bulk",
+            data_schema=vol.Schema(
+                {
+                    vol.Optional(
+                        CONF_TOKENS,
+                        default=user_input.get(CONF_TOKENS, "")
+                    ): TextSelector(TextSelectorConfig(multiline=True)),
+                    vol.Optional(
+                        CONF_TOKEN_FILE,
+                        default=user_input.get(CONF_TOKEN_FILE, "")
+                    ): str,
+                }
+            ),
+            errors=errors,
+            description_placeholders={
+                "discovered": str(len(self._discovered))
+            }
+        )
+
+    async def _async_discover(self):
+        """Return {host: device id} of the devices not configured yet."""
+        configured = {
+            entry.options.get(CONF_HOST, entry.data.get(CONF_HOST))
+            for entry in self._async_current_entries()
+        }
+        try:
+            devices = await async_discover()
+        except OSError as ex:
+            _LOGGER.warning("Unable to discover the devices: %s", ex)
+            return {}
+
+        return {
+            host: device_id for host, device_id in devices.items()
+            if host not in configured
+        }
+
+    async def _async_add_devices(self, devices):
+        """Validate the devices concurrently and start a flow for each."""
+        semaphore = asyncio.Semaphore(DISCOVERY_CONCURRENCY)
+
+        async def _async_validate(host, token):
+            async with semaphore:
+                try:
+                    return await validate_input(
+                        self.hass, {CONF_HOST: host, CONF_TOKEN: token})
+                except PlatformNotReady:
+                    _LOGGER.warning("Unable to connect to %s", host)
+                    return None
+
+        results = await asyncio.gather(
+            *[_async_validate(host, token) for host, token in devices.items()])
+
+        configured = set(self._async_current_ids())
+        added = 0
+        for (host, token), info in zip(devices.items(), results):
+            if info is None or info["mac"] in configured:
+                continue
+            configured.add(info["mac"])
+            added += 1
+            self.hass.async_create_task(
+                self.hass.config_entries.flow.async_init(
+                    DOMAIN,
+                    context={"source": SOURCE_IMPORT},
+                    data={
+                        CONF_HOST: host,
+                        CONF_TOKEN: token,
+                        IMPORT_INFO: info
+                    }
+                )
+            )
+
+        return self.async_abort(
+            reason="bulk_added",
+            description_placeholders={
+                "added": str(added),
+                "failed": str(results.count(None))
+            }
+        )
+
+    async def _async_add_device(self, info):
+        """Create the entry of a validated device."""
+        # prevent setting up the same account twice
+        await self.async_set_unique_id(info["mac"])
+        self._abort_if_unique_id_configured()
+        self._name = info["title"]
+        self._device_info = info[CONF_DEVICE_INFO]
+        return self._async_get_entry()
+
     @property
     def _name(self):
         # pylint: disable=no-member
@@ -141,7 +359,8 @@ class MosquitoDispellerFlowHandler(ConfigFlow, domain=DOMAIN):
             data={
                 CONF_HOST: self._host,
                 CONF_TOKEN: self._token,
-                CONF_NAME: self._name
+                CONF_NAME: self._name,
+                CONF_DEVICE_INFO: self._device_info
             },
         )
 
@@ -158,9 +377,20 @@ class OptionsFlowHandler(OptionsFlow):
 
     async def async_step_init(self, user_input=None):
         """Manage options."""
+        errors = {}
         if user_input is not None:
             if not is_ip_address(user_input.get(CONF_HOST)):
                 return self.async_abort(reason="connection_error")
+            model = self.config_entry.data.get(
+                CONF_DEVICE_INFO, {}).get("model")
+            try:
+                parse_schedule(user_input.get(CONF_SCHEDULE, ""),
+                               get_profile(model).preset_modes)
+            except vol.Invalid as ex:
+                _LOGGER.warning("Invalid schedule: %s", ex)
+                errors[CONF_SCHEDULE] = "invalid_schedule"
+
+        if user_input is not None and not errors:
             self._host = user_input.get(CONF_HOST)
             if len(user_input.get(CONF_TOKEN, "")) >= 1:
                 self._token = user_input.get(CONF_TOKEN)
@@ -169,10 +399,16 @@ class OptionsFlowHandler(OptionsFlow):
                 data={
                     CONF_HOST: self._host,
                     CONF_TOKEN: self._token,
+                    CONF_SCAN_INTERVAL: user_input.get(CONF_SCAN_INTERVAL),
+                    CONF_SCHEDULE: user_input.get(CONF_SCHEDULE, ""),
                 },
             )
         self._host = self.config_entry.options.get(CONF_HOST, '')
         self._token = self.config_entry.options.get(CONF_TOKEN, '')
+        scan_interval = self.config_entry.options.get(
+            CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL.total_seconds())
+        schedule = (user_input or self.config_entry.options).get(
+            CONF_SCHEDULE, "")
 
         return self.async_show_form(
             step_id="init",
@@ -180,6 +416,12 @@ class OptionsFlowHandler(OptionsFlow):
                 {
                     vol.Required(CONF_HOST, default=self._host): str,
                     vol.Required(CONF_TOKEN, default=self._token): str,
+                    vol.Optional(CONF_SCAN_INTERVAL, default=int(
+                        scan_interval)): vol.All(
+                            vol.Coerce(int), vol.Range(min=5)),
+                    vol.Optional(CONF_SCHEDULE, default=schedule):
+                        TextSelector(TextSelectorConfig(multiline=True)),
                 }
             ),
+            errors=errors,
         )
@@ -1,11 +1,63 @@
 """Constants for the Dakuo Mosquito Dispeller integration."""
+from datetime import timedelta
 
 DEFAULT_NAME = "Dakuo Mosquito Dispeller"
 
 DOMAIN = "dakuo_mosquito_dispeller"
 DOMAINS = ["sensor", "fan"]
 
-MOSQUITO_DISPELLER_DATA = "mosquito_dispeller_data"
+MOSQUITO_DISPELLER_SETUP = "mosquito_dispeller_setup"
+MOSQUITO_DISPELLER_LIQUID = "mosquito_dispeller_liquid"
+MOSQUITO_DISPELLER_SCHEDULE = "mosquito_dispeller_schedule"
+
+CONF_SETUP_CONCURRENCY = "setup_concurrency"
+CONF_SETUP_TIMEOUT = "setup_timeout"
+# directories of the recorded miIO traffic, see replay.py
+CONF_RECORD = "record"
+CONF_REPLAY = "replay"
+
+DEFAULT_SETUP_CONCURRENCY = 8
+DEFAULT_SETUP_TIMEOUT = 15
+
+SERVICE_SET_FLEET = "set_fleet"
+ATTR_POWER = "power"
+# devices commanded at the same time by the fleet service
+FLEET_CONCURRENCY = 10
+
+CONF_SCHEDULE = "schedule"
+CONF_TOKENS = "tokens"
+CONF_TOKEN_FILE = "token_file"
+# devices validated at the same time when added in bulk
+DISCOVERY_CONCURRENCY = 10
+
+# miIO.info fields cached in the config entry, with the resolved did
+CONF_DEVICE_INFO = "device_info"
+DEVICE_INFO_KEYS = ("model", "fw_ver", "hw_ver", "mac", "uid")
+
+DEFAULT_SCAN_INTERVAL = timedelta(seconds=30)
+# after a command the device is polled fast for a short while
+FAST_SCAN_INTERVAL = timedelta(seconds=5)
+FAST_SCAN_PERIOD = timedelta(seconds=30)
+# an unreachable device is probed with an exponential backoff after
+# this many consecutive failures
+BREAKER_THRESHOLD = 3
+MAX_BACKOFF_INTERVAL = timedelta(minutes=30)
+# liquid level changes kept per device to estimate the consumption
+LIQUID_HISTORY_SIZE = 48
+LIQUID_HISTORY_SAVE_DELAY = 60
+# the device doesn't provide the new state immediately after a command
+CONFIRM_DELAY = timedelta(seconds=2)
+# a property the device fails to read, e.g. the liquid level of an empty
+# cartridge, is left out of the polls for a while
+NEGATIVE_CACHE_TTL = timedelta(minutes=5)
+# MIoT codes of a property that can't be read (not readable, service or
+# property not found, which is also how an empty cartridge is reported);
+# the other codes are transient errors
+MIOT_UNREADABLE_CODES = (-4001, -4003, -704030013, -704040002, -704040003)
+# an idle device is polled less often: off, or on with a liquid level
+# unchanged for LIQUID_STABLE_PERIOD while it drops about 1% an hour in use
+SLOW_SCAN_FACTOR = 4
+LIQUID_STABLE_PERIOD = timedelta(hours=3)
 
 ATTR_MODEL = "model"
 ATTR_PRESET_MODE = "preset mode"
@@ -13,7 +65,28 @@ ATTR_FW_VER = "Firmware version"
 ATTR_HW_VER = "Hardware version"
 ATTR_LIQUID_LEFT = "Liquid Left"
 
+# preset mode turning the fan off
+PRESET_MODE_OFF = "off"
 FAN_SPEED_LEVEL1 = "Power Mode"
 FAN_SPEED_LEVEL2 = "Mom and Kids Mode"
 
+# MIoT value of each preset mode
+PRESET_MODE_VALUES = {
+    FAN_SPEED_LEVEL1: 0,
+    FAN_SPEED_LEVEL2: 1,
+}
+
 MANUFACTURER = "Dakuo"
+
+PROPERTY_DID = "did"
+PROPERTY_POWER = "power"
+PROPERTY_MODE = "mode"
+PROPERTY_LIQUID_LEFT = "liquid_left"
+
+# MIoT (siid, piid) of the properties read on every poll
+MIOT_PROPERTIES = {
+    PROPERTY_POWER: (6, 1),
+    PROPERTY_MODE: (6, 2),
+    PROPERTY_LIQUID_LEFT: (5, 1),
+}
+MIOT_DID = (1, 3)
@@ -0,0 +1,295 @@
+""" Data update coordinator for Dakuo Mosquito Dispeller."""
+import asyncio
+import logging
+import time
+
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.update_coordinator import (
+    DataUpdateCoordinator,
+    UpdateFailed
+)
+
+from .const import (
+    BREAKER_THRESHOLD,
+    CONFIRM_DELAY,
+    DEFAULT_SCAN_INTERVAL,
+    FAST_SCAN_INTERVAL,
+    FAST_SCAN_PERIOD,
+    LIQUID_STABLE_PERIOD,
+    MAX_BACKOFF_INTERVAL,
+    MIOT_DID,
+    MIOT_UNREADABLE_CODES,
+    NEGATIVE_CACHE_TTL,
+    PROPERTY_DID,
+    PROPERTY_LIQUID_LEFT,
+    PROPERTY_MODE,
+    PROPERTY_POWER,
+    SLOW_SCAN_FACTOR
+)
+from .models import DEFAULT_PROFILE
+from .protocol import DeviceException
+
+_LOGGER = logging.getLogger(__name__)
+
+# properties read on every poll, they decide if the fan is available
+ALWAYS_READ = (PROPERTY_DID, PROPERTY_POWER, PROPERTY_MODE)
+
+
+class CommandQueue:
+    """Serialize the writes to a device and merge the pending ones.
+
+    Writes queued while another one is in flight are sent together in the
+    next request, and only the latest value of each property is sent.
+    """
+
+    def __init__(self, send):
+        """Initialize the queue with the coroutine writing the values."""
+        self._send = send
+        self._lock = asyncio.Lock()
+        self._pending = {}
+        self._waiters = []
+
+    async def async_write(self, values):
+        """Queue property values and return the result of their write."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.update(values)
+        self._waiters.append(future)
+
+        async with self._lock:
+            # an earlier caller may have sent our values already
+            if not future.done():
+                values, self._pending = self._pending, {}
+                waiters, self._waiters = self._waiters, []
+                try:
+                    result = await self._send(values) if values else []
+                except Exception as ex:  # pylint: disable=broad-except
+                    self._resolve(waiters, exception=ex)
+                except BaseException:
+                    # cancelled, the other callers must not wait forever
+                    self._resolve(
+                        [waiter for waiter in waiters if waiter is not future],
+                        exception=DeviceException("The write was cancelled"))
+                    raise
+                else:
+                    self._resolve(waiters, result=result)
+
+        return await future
+
+    @staticmethod
+    def _resolve(waiters, result=None, exception=None):
+        """Set the result or the exception of the pending waiters."""
+        for waiter in waiters:
+            if waiter.done():
+                # the caller was cancelled
+                continue
+            if exception is not None:
+                waiter.set_exception(exception)
+            else:
+                waiter.set_result(result)
+
+
+class MosquitoDispellerCoordinator(DataUpdateCoordinator):
+    """Fetch all properties of a Mosquito Dispeller in one request.
+
+    The device doesn't report its changes over the LAN, so it is polled, but
+    the entities are only notified when a property actually changed.
+    """
+
+    def __init__(self, hass, device, name, did=None,
+                 scan_interval=DEFAULT_SCAN_INTERVAL, liquid=None,
+                 profile=DEFAULT_PROFILE):
+        # pylint: disable=too-many-arguments
+        """Initialize the Mosquito Dispeller coordinator."""
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=name,
+            update_interval=scan_interval,
+            always_update=False
+        )
+        self.device = device
+        self.did = did
+        self.liquid = liquid
+        self.profile = profile
+        self._scan_interval = scan_interval
+        self._fast_until = 0
+        self._command_time = 0
+        self._poll_time = 0
+        self._unsub_confirm = None
+        self._failures = 0
+        self._failing = {}
+        self._commands = CommandQueue(self._async_send_properties)
+
+    @property
+    def consecutive_failures(self):
+        """Return the number of polls failed in a row."""
+        return self._failures
+
+    @property
+    def failing_properties(self):
+        """Return the error code of the properties left out of the polls."""
+        return {key: code for key, (_, code) in self._failing.items()}
+
+    @property
+    def pending_confirm(self):
+        """Return true if the data predates the last command."""
+        return self._poll_time < self._command_time
+
+    @callback
+    def async_command_sent(self):
+        """Confirm the state shortly and poll fast after a command."""
+        self._command_time = time.monotonic()
+        self._fast_until = self._command_time + \
+            FAST_SCAN_PERIOD.total_seconds()
+
+        if self._unsub_confirm is not None:
+            self._unsub_confirm()
+        self._unsub_confirm = async_call_later(
+            self.hass, CONFIRM_DELAY, self._async_confirm)
+
+    async def async_shutdown(self):
+        """Cancel the pending confirm read and the scheduled refresh."""
+        if self._unsub_confirm is not None:
+            self._unsub_confirm()
+            self._unsub_confirm = None
+        await super().async_shutdown()
+
+    async def _async_confirm(self, _now):
+        """Read back the state after a command."""
+        self._unsub_confirm = None
+        await self.async_refresh()
+
+    def _next_update_interval(self, data):
+        """Return the poll interval matching the device state."""
+        # the level is unchanged between most polls of a device in use,
+        # only a level unchanged for hours means it isn't consuming
+        last_change = self.liquid.last_change if self.liquid else None
+        stable = last_change is not None and (
+            time.time() - last_change
+            > LIQUID_STABLE_PERIOD.total_seconds())
+
+        if time.monotonic() < self._fast_until:
+            return FAST_SCAN_INTERVAL
+        if not data.get(PROPERTY_POWER) or stable:
+            return self._scan_interval * SLOW_SCAN_FACTOR
+        return self._scan_interval
+
+    def _failed(self, ex):
+        """Count a failed poll and back off once the breaker is open."""
+        self._failures += 1
+        if self._failures == BREAKER_THRESHOLD:
+            _LOGGER.warning("%s is unreachable, backing off", self.name)
+        if self._failures >= BREAKER_THRESHOLD:
+            self.update_interval = min(
+                self._scan_interval * 2 ** (
+                    self._failures - BREAKER_THRESHOLD),
+                MAX_BACKOFF_INTERVAL
+            )
+        else:
+            self.update_interval = self._scan_interval
+
+        return UpdateFailed(
+            "Got exception while fetching the state: {}".format(ex))
+
+    async def _async_probe(self):
+        """Check an unreachable device with a single cheap request."""
+        siid, piid = self.profile.properties[PROPERTY_POWER]
+        try:
+            await self.device.async_send(
+                "get_properties",
+                [{"piid": piid, "siid": siid, "did": str(self.did)}],
+                retry_count=0
+            )
+        except DeviceException as ex:
+            raise self._failed(ex) from ex
+
+        _LOGGER.info("%s is reachable again", self.name)
+
+    def _build_request(self, now):
+        """Return the property list of the batched get_properties."""
+        properties = {
+            key: value for key, value in self.profile.properties.items()
+            if key not in self._failing or self._failing[key][0] <= now
+        }
+        if self.did is None:
+            properties[PROPERTY_DID] = MIOT_DID
+
+        return properties, [
+            {"piid": piid, "siid": siid, "did": str(self.did)}
+            for siid, piid in properties.values()
+        ]
+
+    async def async_set_properties(self, values):
+        """Write several properties with a single set_properties."""
+        return await self._commands.async_write(values)
+
+    async def _async_send_properties(self, values):
+        """Send the set_properties request of the queued values."""
+        request = []
+        for key, value in values.items():
+            siid, piid = self.profile.properties[key]
+            request.append(
+                {"piid": piid, "siid": siid, "did": str(self.did),
+                 "value": value})
+
+        return await self.device.async_send("set_properties", request)
+
+    async def _async_update_data(self):
+        """Fetch state from the device."""
+        poll_time = time.monotonic()
+        # the entities drop their optimistic state on the first poll after a
+        # command, even if it didn't change the data
+        self.always_update = self.pending_confirm
+        if self._failures >= BREAKER_THRESHOLD:
+            await self._async_probe()
+
+        properties, request = self._build_request(poll_time)
+        lookup = {value: key for key, value in properties.items()}
+
+        try:
+            status = await self.device.async_send("get_properties", request)
+        except DeviceException as ex:
+            raise self._failed(ex) from ex
+        self._failures = 0
+
+        data = {}
+        transient = []
+        for item in status:
+            key = lookup.get((item.get("siid"), item.get("piid")))
+            if key is None:
+                continue
+            code = item.get("code")
+            if code == 0:
+                data[key] = item.get("value")
+                self._failing.pop(key, None)
+            elif code in MIOT_UNREADABLE_CODES and key not in ALWAYS_READ:
+                if key not in self._failing:
+                    _LOGGER.debug("%s can't read %s (code %s)",
+                                  self.name, key, code)
+                self._failing[key] = (
+                    poll_time + NEGATIVE_CACHE_TTL.total_seconds(), code)
+            else:
+                transient.append(key)
+
+        if PROPERTY_DID in data:
+            self.did = data.pop(PROPERTY_DID)
+
+        # only the levels read from the device go to the history, the
+        # fallback below would look like a drop followed by a refill
+        if self.liquid is not None and PROPERTY_LIQUID_LEFT in data:
+            self.liquid.add(time.time(), data[PROPERTY_LIQUID_LEFT])
+
+        # a property failing once keeps its last value
+        for key in transient:
+            if self.data and key in self.data:
+                data[key] = self.data[key]
+
+        if PROPERTY_LIQUID_LEFT in self.profile.properties:
+            # If failed to get liquid-left, it means liquid left 0.
+            data.setdefault(PROPERTY_LIQUID_LEFT, 0)
+
+        self._poll_time = poll_time
+        self.update_interval = self._next_update_interval(data)
+
+        return data
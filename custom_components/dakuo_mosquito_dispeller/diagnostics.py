@@ -0,0 +1,38 @@
+""" Diagnostics support for Dakuo Mosquito Dispeller."""
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_TOKEN
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+TO_REDACT = {CONF_TOKEN, "mac", "uid", "did", "token"}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+):
+    """Return diagnostics of a config entry."""
+    runtime = hass.data[DOMAIN].get(entry.entry_id)
+    coordinator = runtime.coordinator
+
+    return {
+        "entry": {
+            "data": async_redact_data(dict(entry.data), TO_REDACT),
+            "options": async_redact_data(dict(entry.options), TO_REDACT),
+        },
+        "device_info": async_redact_data(
+            runtime.device_info.raw, TO_REDACT),
+        "coordinator": {
+            "data": coordinator.data,
+            "last_update_success": coordinator.last_update_success,
+            "update_interval": coordinator.update_interval.total_seconds(),
+            "consecutive_failures": coordinator.consecutive_failures,
+            "failing_properties": coordinator.failing_properties,
+        },
+        "profile": {
+            "properties": coordinator.profile.properties,
+            "preset_modes": coordinator.profile.preset_modes,
+        },
+        "transport": runtime.device.stats.as_dict(),
+    }
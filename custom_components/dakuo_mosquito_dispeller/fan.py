@@ -1,19 +1,15 @@
 """ Support for Dakuo Mosquito Dispeller."""
 import logging
-from functools import partial
 
-from miio import Device, DeviceException
 from homeassistant.const import (
-    CONF_HOST,
-    CONF_TOKEN,
     ATTR_MODE
 )
-from homeassistant.exceptions import PlatformNotReady
+from homeassistant.core import callback
 from homeassistant.components.fan import (
     FanEntity,
-    SUPPORT_PRESET_MODE,
-    SPEED_OFF
+    SUPPORT_PRESET_MODE
 )
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 from .const import (
     ATTR_FW_VER,
@@ -22,11 +18,13 @@ from .const import (
     ATTR_MODEL,
     ATTR_PRESET_MODE,
     DOMAIN,
-    FAN_SPEED_LEVEL1,
-    FAN_SPEED_LEVEL2,
-    MOSQUITO_DISPELLER_DATA,
-    MANUFACTURER
+    MANUFACTURER,
+    PRESET_MODE_OFF,
+    PROPERTY_LIQUID_LEFT,
+    PROPERTY_MODE,
+    PROPERTY_POWER
 )
+from .protocol import DeviceException
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -36,12 +34,6 @@ AVAILABLE_ATTRIBUTES_FAN = {
 
 SUCCESS = ["ok"]
 
-FAN_PRESET_MODES = {
-    SPEED_OFF: 0,
-    FAN_SPEED_LEVEL1: 0,
-    FAN_SPEED_LEVEL2: 1,
-}
-
 
 async def async_setup_entry(hass,
                             config_entry,
@@ -50,77 +42,63 @@ async def async_setup_entry(hass,
     # pylint: disable=unused-argument, too-many-locals
     """Set up the  Mosquito Dispeller Fan device from config."""
 
-    if MOSQUITO_DISPELLER_DATA not in hass.data:
-        hass.data[MOSQUITO_DISPELLER_DATA] = {}
-
-    if config_entry.data.get(CONF_HOST, None):
-        host = config_entry.data[CONF_HOST]
-        token = config_entry.data[CONF_TOKEN]
-    else:
-        host = config_entry.options[CONF_HOST]
-        token = config_entry.options[CONF_TOKEN]
-
+    runtime = hass.data[DOMAIN].get(config_entry.entry_id)
+    device_info = runtime.device_info
     name = config_entry.title
-
-    _LOGGER.info("Initializing with host %s (token %s...)", host, token[:5])
-    unique_id = None
-
-    try:
-        miio_device = Device(host, token)
-        device_info = miio_device.info()
-        if device_info.model:
-            model = device_info.model
-        miio_uid = device_info.raw['uid']
-        unique_id = "fan-{}".format(device_info.mac_address)
-    except DeviceException:
-        raise PlatformNotReady
+    unique_id = "fan-{}".format(device_info.mac_address)
 
     device = MosquitoDispellerFan(
-        "{} Switch ".format(
-            name[:-5]), miio_device, model, unique_id, miio_uid)
-    hass.data[MOSQUITO_DISPELLER_DATA][host] = device
-    async_add_entities([device], update_before_add=True)
+        runtime.coordinator,
+        "{} Switch ".format(name[:-5]),
+        runtime.device,
+        device_info,
+        unique_id
+    )
+    runtime.entities.append(device)
+    async_add_entities([device])
 
 
-class MosquitoDispellerFan(FanEntity):
+class MosquitoDispellerFan(CoordinatorEntity, FanEntity):
     # pylint: disable=too-many-instance-attributes
     """Representation of a Mosquito Dispeller Fan."""
 
-    def __init__(self, name, device, model, unique_id, miio_uid):
+    def __init__(self, coordinator, name, device, device_info, unique_id):
+        # pylint: disable=too-many-arguments
         """Initialize the Mosquito Dispeller Fan."""
-        super().__init__()
-        self._model = model
+        super().__init__(coordinator)
+        self._model = device_info.model
         self._unique_id = unique_id
         self._device = device
         self._name = name
-        self._skip_update = False
-        self._did = miio_uid
+        self._did = coordinator.did or device_info.mac_address
+        self._profile = coordinator.profile
         self._available = False
         self._state = None
         self._preset_mode = None
-        self._preset_modes = list(FAN_PRESET_MODES)
+        self._preset_modes = [PRESET_MODE_OFF, *self._profile.preset_modes]
         self._preset_mode_attr = None
         self._liquid_left = 0
-        self._device_info = device.info()
+        self._optimistic = {}
+        self._written = None
+        self._device_info = device_info
 
-        self._state_attrs = {
+        self._static_attrs = {
             ATTR_MODEL: self._model,
             ATTR_FW_VER: self._device_info.firmware_version,
             ATTR_HW_VER: self._device_info.hardware_version
             }
+        self._state_attrs = self._static_attrs
+        self._update_state()
 
     @property
     def supported_features(self) -> int:
         """Flag supported features."""
+        if PROPERTY_MODE not in self._profile.properties:
+            return 0
         return (
             SUPPORT_PRESET_MODE
         )
 
-    @property
-    def should_poll(self):
-        """Poll the device."""
-        return True
-
     @property
     def unique_id(self):
         """Return an unique ID."""
@@ -134,16 +112,11 @@ class MosquitoDispellerFan(FanEntity):
     @property
     def available(self):
         """Return true when state is known."""
-        return self._available
+        return super().available and self._available
 
     @property
     def extra_state_attributes(self):
         """Return the state attributes of the device."""
-        attrs = {
-            ATTR_PRESET_MODE: self._preset_mode_attr,
-            ATTR_LIQUID_LEFT: self._liquid_left
-        }
-        self._state_attrs.update(attrs)
         return self._state_attrs
 
     @property
@@ -155,7 +128,7 @@ class MosquitoDispellerFan(FanEntity):
     def preset_mode(self):
         """Get the current preset mode."""
         if self._state:
-            return self._preset_mode
+            return self._preset_mode_attr
 
         return None
 
@@ -176,42 +149,50 @@ class MosquitoDispellerFan(FanEntity):
         """Call a miio device command handling error messages."""
 
         try:
-            result = await self.hass.async_add_job(partial(
-                func, *args, **kwargs))
+            result = await func(*args, **kwargs)
 
             _LOGGER.debug("Response received from miio device: %s", result)
+            self.coordinator.async_command_sent()
 
-            return result == SUCCESS
+            if result == SUCCESS:
+                return True
+            # MIoT answers every property with its own result code
+            return isinstance(result, list) and all(
+                item.get("code") == 0 for item in result)
         except DeviceException as exc:
             _LOGGER.error(mask_error, exc)
             self._available = False
             return False
 
-    async def async_turn_on(self, speed: str = None, **kwargs) -> None:
-        """Turn the device on."""
+    async def _async_set_properties(self, mask_error, values):
+        """Write properties in one request and show them optimistically."""
         result = await self._try_command(
-            "Turning the miio device on failed.",
-            self._device.send,
-            "set_properties",
-            [{"piid": 1, "siid": 6, "did": str(self._did), "value": 1}]
+            mask_error,
+            self.coordinator.async_set_properties,
+            values
         )
 
         if result:
-            self._state = True
-            self._skip_update = True
+            self._async_set_optimistic(values)
+
+    async def async_turn_on(self, speed: str = None, percentage: int = None,
+                            preset_mode: str = None, **kwargs) -> None:
+        """Turn the device on."""
+        if preset_mode == PRESET_MODE_OFF:
+            await self.async_turn_off()
+            return
+
+        values = {PROPERTY_POWER: 1}
+        if preset_mode is not None:
+            values[PROPERTY_MODE] = self._profile.preset_modes[preset_mode]
+
+        await self._async_set_properties(
+            "Turning the miio device on failed.", values)
 
     async def async_turn_off(self, **kwargs) -> None:
         """Turn the device off."""
-        result = await self._try_command(
-            "Turning the miio device off failed.",
-            self._device.send,
-            "set_properties",
-            [{"piid": 1, "siid": 6, "did": str(self._did), "value": 0}]
-        )
-
-        if result:
-            self._state = False
-            self._skip_update = True
+        await self._async_set_properties(
+            "Turning the miio device off failed.", {PROPERTY_POWER: 0})
 
     @property
     def preset_modes(self):
@@ -221,86 +202,64 @@ class MosquitoDispellerFan(FanEntity):
     async def async_set_preset_mode(self, preset_mode: str) -> None:
         """Set the preset mode of the fan."""
 
-        if preset_mode == SPEED_OFF:
+        if preset_mode == PRESET_MODE_OFF:
             await self.async_turn_off()
             return
 
-        if preset_mode == FAN_SPEED_LEVEL1:
-            value = 0
-        else:
-            value = 1
-        await self._try_command(
+        await self._async_set_properties(
             "Setting fan speed of the miio device failed.",
-            self._device.send,
-            "set_properties",
-            [{"piid": 2, "siid": 6, "did": str(self._did), "value": value}])
-
-    async def async_update(self):
-        """Fetch state from the device."""
-
-        # On state change the device doesn't provide the new state immediately.
-        if self._skip_update:
-            self._skip_update = False
-            return
-
-        try:
-            if self._did is None:
-                status = await self.hass.async_add_job(
-                    self._device.raw_command,
-                    "get_properties",
-                    [{"piid": 3, "siid": 1, "did": str(self._did)}]
-                )
-                if status[0]['code'] == 0:
-                    self._did = status[0]['value']
-                else:
-                    self._did = self._unique_id
-
-            status = await self.hass.async_add_job(
-                self._device.raw_command,
-                "get_properties",
-                [{"piid": 1, "siid": 6, "did": str(self._did)}]
-            )
-
-            self._available = False
-            if status[0]['code'] == 0:
-                self._state = status[0]['value']
-                self._available = True
-
-            status = await self.hass.async_add_job(
-                self._device.raw_command,
-                "get_properties",
-                [{"piid": 2, "siid": 6, "did": str(self._did)}]
-            )
-
-            self._available = False
-            if status[0]['code'] == 0:
-                self._preset_mode = status[0]['value']
-                if self._preset_mode == 0:
-                    self._preset_mode_attr = FAN_SPEED_LEVEL1
-                else:
-                    self._preset_mode_attr = FAN_SPEED_LEVEL2
-                self._available = True
-
-        except DeviceException as ex:
-            self._available = False
-            _LOGGER.error(
-                "Got exception while fetching the state: %s",
-                ex
-            )
-            return
+            {PROPERTY_MODE: self._profile.preset_modes[preset_mode]})
+
+    @callback
+    def _async_set_optimistic(self, values):
+        """Show the commanded values until the device confirms them."""
+        self._optimistic.update(values)
+        self._update_state()
+        self._written = self._state_key()
+        self.async_write_ha_state()
+
+    def _update_state(self):
+        """Update the entity state from the coordinator data."""
+        data = self.coordinator.data or {}
+        if self.coordinator.pending_confirm:
+            data = {**data, **self._optimistic}
+        else:
+            self._optimistic = {}
 
-        try:
-            status = await self.hass.async_add_job(
-                self._device.raw_command,
-                "get_properties",
-                [{"piid": 1, "siid": 5, "did": str(self._did)}]
-            )
+        self._available = False
+        if PROPERTY_POWER in data:
+            self._state = bool(data[PROPERTY_POWER])
+            self._preset_mode = data.get(PROPERTY_MODE)
+            self._preset_mode_attr = self._profile.preset_names.get(
+                self._preset_mode)
+            self._available = (
+                PROPERTY_MODE in data or
+                PROPERTY_MODE not in self._profile.properties)
+
+        self._liquid_left = data.get(PROPERTY_LIQUID_LEFT, 0)
+        # a new dict, the written state keeps referencing the previous one
+        self._state_attrs = {
+            **self._static_attrs,
+            ATTR_PRESET_MODE: self._preset_mode_attr,
+            ATTR_LIQUID_LEFT: self._liquid_left
+        }
 
-            self._available = False
-            if status[0]['code'] == 0:
-                self._liquid_left = status[0]['value']
-                self._available = True
+    def _state_key(self):
+        """Return the values shown by the entity, with its availability."""
+        return (
+            self.available,
+            self._state,
+            self._preset_mode_attr,
+            self._liquid_left
+        )
 
-        except DeviceException as ex:
-            # If get exception while getting liquid-left, it means liquid left 0.
-            self._liquid_left = 0
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Handle updated data from the coordinator."""
+        # compared with the last written state, the coordinator changed its
+        # last_update_success, hence available, before calling the listeners
+        self._update_state()
+        state = self._state_key()
+        if state != self._written:
+            self._written = state
+            super()._handle_coordinator_update()
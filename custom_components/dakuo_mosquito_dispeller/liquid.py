@@ -0,0 +1,150 @@
+""" Liquid consumption tracking of Dakuo Mosquito Dispeller."""
+import time
+from collections import deque
+
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    DOMAIN,
+    LIQUID_HISTORY_SAVE_DELAY,
+    LIQUID_HISTORY_SIZE
+)
+
+STORAGE_KEY = "{}.liquid_history".format(DOMAIN)
+STORAGE_VERSION = 1
+
+
+class LiquidTracker:
+    """Rolling history of the liquid level of one device.
+
+    Only level changes are recorded. A least squares fit of the samples is
+    kept up to date incrementally, so the consumption rate is available
+    without walking the history. The last level still holds now, so it is
+    also fitted at the current time and the rate decreases while the level
+    doesn't change, e.g. when the device is off.
+    """
+
+    def __init__(self, on_change=None, samples=None):
+        """Initialize the tracker, optionally with stored samples."""
+        self._on_change = on_change
+        self._samples = deque(maxlen=LIQUID_HISTORY_SIZE)
+        self._origin = None
+        self._sums = [0.0] * 5
+        for timestamp, level in samples or []:
+            self._append(timestamp, level)
+
+    @property
+    def samples(self):
+        """Return the (timestamp, level) samples, oldest first."""
+        return list(self._samples)
+
+    @property
+    def level(self):
+        """Return the last recorded level."""
+        return self._samples[-1][1] if self._samples else None
+
+    @property
+    def last_change(self):
+        """Return the timestamp of the last level change."""
+        return self._samples[-1][0] if self._samples else None
+
+    @property
+    def rate(self):
+        """Return the consumption in percent per hour."""
+        if len(self._samples) < 2:
+            return None
+        now = max(time.time(), self.last_change)
+        count, sum_x, sum_y, sum_xx, sum_xy = [
+            total + term for total, term in zip(
+                self._sums, self._terms(now, self.level))
+        ]
+        denominator = count * sum_xx - sum_x * sum_x
+        if count < 2 or denominator <= 0:
+            return None
+
+        slope = (count * sum_xy - sum_x * sum_y) / denominator
+        return max(-slope, 0.0)
+
+    @property
+    def time_to_empty(self):
+        """Return the estimated hours from now until the liquid runs out."""
+        rate = self.rate
+        if not rate:
+            return None
+        return self.level / rate
+
+    def _terms(self, timestamp, level):
+        hours = (timestamp - self._origin) / 3600
+        return (1, hours, level, hours * hours, hours * level)
+
+    def _update_sums(self, timestamp, level, sign):
+        for index, value in enumerate(self._terms(timestamp, level)):
+            self._sums[index] += sign * value
+
+    def _append(self, timestamp, level):
+        if self._origin is None:
+            self._origin = timestamp
+        if len(self._samples) == self._samples.maxlen:
+            self._update_sums(*self._samples[0], -1)
+        self._samples.append((timestamp, level))
+        self._update_sums(timestamp, level, 1)
+
+    def _reset(self):
+        self._samples.clear()
+        self._origin = None
+        self._sums = [0.0] * 5
+
+    def add(self, timestamp, level):
+        """Record the level if it changed; a higher level is a refill."""
+        last = self.level
+        if level is None or level == last:
+            return
+
+        if last is not None and level > last:
+            self._reset()
+        self._append(timestamp, level)
+
+        if self._on_change is not None:
+            self._on_change()
+
+
+class LiquidHistory:
+    """Persisted liquid level history of all the devices."""
+
+    def __init__(self, hass):
+        """Initialize the history."""
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._trackers = {}
+        self._stored = {}
+
+    async def async_load(self):
+        """Load the stored samples."""
+        self._stored = await self._store.async_load() or {}
+
+    def tracker(self, entry_id):
+        """Return the tracker of a config entry."""
+        if entry_id not in self._trackers:
+            self._trackers[entry_id] = LiquidTracker(
+                self.async_schedule_save, self._stored.pop(entry_id, None))
+        return self._trackers[entry_id]
+
+    @callback
+    def async_remove(self, entry_id):
+        """Forget the history of a removed config entry."""
+        self._trackers.pop(entry_id, None)
+        self._stored.pop(entry_id, None)
+        self.async_schedule_save()
+
+    @callback
+    def async_schedule_save(self):
+        """Save the history after a delay, merging frequent changes."""
+        self._store.async_delay_save(
+            self._data_to_save, LIQUID_HISTORY_SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self):
+        data = dict(self._stored)
+        for entry_id, tracker in self._trackers.items():
+            data[entry_id] = tracker.samples
+        return data
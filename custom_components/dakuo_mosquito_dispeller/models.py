@@ -0,0 +1,32 @@
+""" Capabilities of the Dakuo Mosquito Dispeller models."""
+from .const import MIOT_PROPERTIES, PRESET_MODE_VALUES
+
+
+class ModelProfile:
+    # pylint: disable=too-few-public-methods
+    """MIoT properties and preset modes of a model."""
+
+    def __init__(self, properties, preset_modes):
+        """Initialize the profile.
+
+        properties maps the property names to their MIoT (siid, piid), only
+        these properties are polled. preset_modes maps the preset mode names
+        to their MIoT mode value.
+        """
+        self.properties = properties
+        self.preset_modes = preset_modes
+        self.preset_names = {
+            value: name for name, value in preset_modes.items()
+        }
+
+
+DEFAULT_PROFILE = ModelProfile(MIOT_PROPERTIES, PRESET_MODE_VALUES)
+
+# profiles of the miIO models differing from the default one, e.g.
+# "dakuo.mosq.xxx": ModelProfile({PROPERTY_POWER: (2, 1)}, {"Auto": 0})
+MODELS = {}
+
+
+def get_profile(model):
+    """Return the profile of a miIO model."""
+    return MODELS.get(model, DEFAULT_PROFILE)
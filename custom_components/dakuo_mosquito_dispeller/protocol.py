@@ -0,0 +1,446 @@
+""" Asyncio transport for the miIO protocol."""
+import asyncio
+import hashlib
+import json
+import logging
+import struct
+import time
+from collections import deque
+
+_LOGGER = logging.getLogger(__name__)
+
+MIIO_PORT = 54321
+MAGIC = 0x2131
+HEADER_LENGTH = 32
+HEADER = struct.Struct(">HHIII")
+HELLO = bytes.fromhex("21310020" + "ff" * 28)
+
+DEFAULT_TIMEOUT = 5
+DEFAULT_RETRIES = 3
+DISCOVERY_TIMEOUT = 3
+DISCOVERY_ADDRESS = "<broadcast>"
+
+ERROR_ID_DUPLICATED = -9999
+
+# round trips kept per command type for the latency percentiles
+LATENCY_SAMPLES = 200
+
+
+class DeviceException(Exception):
+    """Exception wrapping any communication errors with the device."""
+
+
+class DeviceError(DeviceException):
+    """Exception communicating an error delivered by the target device."""
+
+    def __init__(self, error):
+        """Initialize from the error object of the response."""
+        self.code = error.get("code")
+        self.message = error.get("message")
+        super().__init__("{} (code {})".format(self.message, self.code))
+
+
+class DeviceInfo:
+    """Container of the miIO.info response."""
+
+    def __init__(self, data):
+        """Initialize the device info."""
+        self.raw = data
+
+    @property
+    def model(self):
+        """Return the model of the device."""
+        return self.raw.get("model")
+
+    @property
+    def firmware_version(self):
+        """Return the firmware version of the device."""
+        return self.raw.get("fw_ver")
+
+    @property
+    def hardware_version(self):
+        """Return the hardware version of the device."""
+        return self.raw.get("hw_ver")
+
+    @property
+    def mac_address(self):
+        """Return the MAC address of the device."""
+        return self.raw.get("mac")
+
+
+def _md5(data):
+    return hashlib.md5(data).digest()
+
+
+def _cipher(token):
+    # cryptography is imported on the first request, not with the integration
+    # pylint: disable=import-outside-toplevel
+    from cryptography.hazmat.primitives.ciphers import (
+        Cipher,
+        algorithms,
+        modes
+    )
+    key = _md5(token)
+    return Cipher(algorithms.AES(key), modes.CBC(_md5(key + token)))
+
+
+def _padding():
+    # pylint: disable=import-outside-toplevel
+    from cryptography.hazmat.primitives import padding
+    return padding.PKCS7(128)
+
+
+def encrypt(token, plaintext):
+    """Encrypt a payload with the key and iv derived from the token."""
+    padder = _padding().padder()
+    padded = padder.update(plaintext) + padder.finalize()
+    encryptor = _cipher(token).encryptor()
+    return encryptor.update(padded) + encryptor.finalize()
+
+
+def decrypt(token, ciphertext):
+    """Decrypt a payload with the key and iv derived from the token."""
+    decryptor = _cipher(token).decryptor()
+    padded = decryptor.update(ciphertext) + decryptor.finalize()
+    unpadder = _padding().unpadder()
+    return unpadder.update(padded) + unpadder.finalize()
+
+
+def build_packet(token, device_id, stamp, payload):
+    """Build an encrypted miIO packet carrying a JSON payload."""
+    data = encrypt(token, json.dumps(payload).encode() + b"\x00")
+    header = HEADER.pack(
+        MAGIC, HEADER_LENGTH + len(data), 0, device_id, stamp)
+    return header + _md5(header + token + data) + data
+
+
+def parse_packet(token, packet):
+    """Return (device id, stamp, payload) of a miIO packet.
+
+    The payload is None for the handshake response.
+    """
+    if len(packet) < HEADER_LENGTH:
+        raise ValueError("Packet too short")
+    magic, length, _, device_id, stamp = HEADER.unpack_from(packet)
+    if magic != MAGIC or length > len(packet):
+        raise ValueError("Invalid packet header")
+    if length == HEADER_LENGTH:
+        return device_id, stamp, None
+
+    data = packet[HEADER_LENGTH:length]
+    if _md5(packet[:16] + token + data) != packet[16:32]:
+        raise ValueError("Invalid packet checksum")
+    payload = decrypt(token, data).rstrip(b"\x00")
+    return device_id, stamp, json.loads(payload)
+
+
+class CommandStats:
+    """Round trip counters and latencies of one command type."""
+
+    def __init__(self):
+        """Initialize the counters."""
+        self.count = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.retries = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def add_latency(self, latency):
+        """Record the duration of a successful request."""
+        self._latencies.append(latency)
+
+    def percentile(self, percent):
+        """Return a latency percentile in seconds of the recent requests."""
+        if not self._latencies:
+            return None
+        latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * percent / 100))
+        return latencies[index]
+
+    def as_dict(self):
+        """Return the counters as a dict."""
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class DeviceStats:
+    """Round trip statistics of a device, per command type."""
+
+    def __init__(self):
+        """Initialize the statistics."""
+        self.commands = {}
+        self.last_error = None
+        self.last_error_time = None
+
+    def command(self, command):
+        """Return the statistics of a command type."""
+        if command not in self.commands:
+            self.commands[command] = CommandStats()
+        return self.commands[command]
+
+    @property
+    def failures(self):
+        """Return the number of failed requests."""
+        return sum(stats.failures for stats in self.commands.values())
+
+    def set_error(self, error):
+        """Record the last error."""
+        self.last_error = str(error)
+        self.last_error_time = time.time()
+
+    def as_dict(self):
+        """Return the statistics as a dict."""
+        return {
+            "commands": {
+                command: stats.as_dict()
+                for command, stats in self.commands.items()
+            },
+            "last_error": self.last_error,
+            "last_error_time": self.last_error_time,
+        }
+
+
+class MiioProtocol(asyncio.DatagramProtocol):
+    """Datagram protocol forwarding the packets to a MiioDevice."""
+
+    def __init__(self, device):
+        """Initialize the protocol."""
+        self._device = device
+
+    def datagram_received(self, data, addr):
+        """Handle a packet from the device."""
+        self._device.packet_received(data)
+
+    def error_received(self, exc):
+        """Handle a socket error, e.g. an unreachable host."""
+        self._device.connection_failed(exc)
+
+    def connection_lost(self, exc):
+        """Handle the closing of the socket."""
+        self._device.connection_failed(exc)
+
+
+class DiscoveryProtocol(asyncio.DatagramProtocol):
+    """Datagram protocol collecting the replies to the hello packet."""
+
+    def __init__(self):
+        """Initialize the protocol."""
+        self.devices = {}
+
+    def datagram_received(self, data, addr):
+        """Record the device id of a handshake reply."""
+        if len(data) != HEADER_LENGTH:
+            return
+        magic, length, _, device_id, _ = HEADER.unpack_from(data)
+        if magic == MAGIC and length == HEADER_LENGTH:
+            self.devices[addr[0]] = device_id
+
+
+async def async_discover(address=DISCOVERY_ADDRESS, timeout=DISCOVERY_TIMEOUT,
+                         port=MIIO_PORT):
+    """Broadcast the hello packet and return {host: device id} of the replies.
+
+    The hello packet is sent twice, as UDP broadcasts are easily lost.
+    """
+    loop = asyncio.get_running_loop()
+    transport, discovery = await loop.create_datagram_endpoint(
+        DiscoveryProtocol,
+        local_addr=("0.0.0.0", 0),
+        allow_broadcast=True
+    )
+    try:
+        for _ in range(2):
+            transport.sendto(HELLO, (address, port))
+            await asyncio.sleep(timeout / 2)
+    finally:
+        transport.close()
+
+    _LOGGER.debug("Discovered %d miIO devices", len(discovery.devices))
+    return discovery.devices
+
+
+class MiioDevice:
+    # pylint: disable=too-many-instance-attributes
+    """Asyncio client of a single miIO device."""
+
+    def __init__(self, host, token, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, port=MIIO_PORT):
+        # pylint: disable=too-many-arguments
+        """Initialize the miIO device."""
+        self.host = host
+        self._port = port
+        self._token = bytes.fromhex(token)
+        self._timeout = timeout
+        self._retries = retries
+        self._transport = None
+        self._closed = False
+        self._device_id = None
+        self._stamp = None
+        self._stamp_time = None
+        self._message_id = 0
+        self._handshake = None
+        self._pending = {}
+        self.stats = DeviceStats()
+
+    def _check_open(self):
+        """Raise if the device was closed, it must not reconnect."""
+        if self._closed:
+            raise DeviceException("The device {} is closed".format(self.host))
+
+    async def _async_connect(self):
+        """Open the UDP socket to the device."""
+        self._check_open()
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: MiioProtocol(self),
+            remote_addr=(self.host, self._port)
+        )
+
+    async def async_handshake(self):
+        """Fetch the device id and stamp needed to talk to the device."""
+        self._check_open()
+        if self._transport is None:
+            await self._async_connect()
+
+        if self._handshake is None:
+            self._handshake = asyncio.get_running_loop().create_future()
+            self._transport.sendto(HELLO)
+        try:
+            await asyncio.wait_for(
+                asyncio.shield(self._handshake), self._timeout)
+        except asyncio.TimeoutError as ex:
+            raise DeviceException(
+                "Unable to discover the device {}".format(self.host)
+            ) from ex
+        finally:
+            self._handshake = None
+
+    async def async_send(self, command, parameters=None, retry_count=None):
+        """Send a command to the device and return its result."""
+        self._check_open()
+        if retry_count is None:
+            retry_count = self._retries
+
+        stats = self.stats.command(command)
+        stats.count += 1
+        start = time.monotonic()
+        try:
+            result = await self._async_send(command, parameters, retry_count)
+        except DeviceException as ex:
+            stats.failures += 1
+            self.stats.set_error(ex)
+            raise
+        stats.add_latency(time.monotonic() - start)
+
+        return result
+
+    async def _async_send(self, command, parameters, retry_count):
+        """Send a command, retrying after timeouts and id errors."""
+        try:
+            if self._stamp is None:
+                await self.async_handshake()
+            response = await self._async_request(command, parameters)
+        except DeviceException:
+            if retry_count <= 0 or self._closed:
+                raise
+            _LOGGER.debug(
+                "Retrying %s to %s, %d retries left",
+                command, self.host, retry_count)
+            self.stats.command(command).retries += 1
+            # force a new handshake, the device may have restarted
+            self._stamp = None
+            return await self._async_send(
+                command, parameters, retry_count - 1)
+
+        if "error" in response:
+            error = DeviceError(response["error"])
+            if error.code == ERROR_ID_DUPLICATED and retry_count > 0:
+                self.stats.command(command).retries += 1
+                self._message_id += 100
+                return await self._async_send(
+                    command, parameters, retry_count - 1)
+            raise error
+
+        return response.get("result")
+
+    async def _async_request(self, command, parameters):
+        """Send one request and wait for the response with the same id."""
+        self._message_id = (self._message_id + 1) % 0x7FFFFFFF
+        message_id = self._message_id
+        elapsed = int(time.monotonic() - self._stamp_time)
+        packet = build_packet(
+            self._token,
+            self._device_id,
+            (self._stamp + elapsed + 1) & 0xFFFFFFFF,
+            {
+                "id": message_id,
+                "method": command,
+                "params": parameters if parameters is not None else []
+            }
+        )
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        try:
+            self._transport.sendto(packet)
+            return await asyncio.wait_for(future, self._timeout)
+        except asyncio.TimeoutError as ex:
+            self.stats.command(command).timeouts += 1
+            raise DeviceException(
+                "No response from the device {}".format(self.host)
+            ) from ex
+        finally:
+            self._pending.pop(message_id, None)
+
+    async def async_info(self):
+        """Return the device info."""
+        return DeviceInfo(await self.async_send("miIO.info"))
+
+    def packet_received(self, packet):
+        """Dispatch a packet to the request waiting for it."""
+        try:
+            device_id, stamp, payload = parse_packet(self._token, packet)
+        except ValueError as ex:
+            _LOGGER.debug("Dropped packet from %s: %s", self.host, ex)
+            return
+
+        self._device_id = device_id
+        self._stamp = stamp
+        self._stamp_time = time.monotonic()
+
+        if payload is None:
+            if self._handshake is not None and not self._handshake.done():
+                self._handshake.set_result(None)
+            return
+
+        future = self._pending.get(payload.get("id"))
+        if future is not None and not future.done():
+            future.set_result(payload)
+
+    def connection_failed(self, exc):
+        """Fail all requests waiting for a response."""
+        if exc is None:
+            exc = DeviceException("Connection closed")
+        elif not isinstance(exc, DeviceException):
+            exc = DeviceException(str(exc))
+
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        if self._handshake is not None and not self._handshake.done():
+            self._handshake.set_exception(exc)
+
+    def close(self):
+        """Close the socket to the device, it can't be used afterwards."""
+        self._closed = True
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        self._stamp = None
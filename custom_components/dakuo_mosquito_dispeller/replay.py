@@ -0,0 +1,178 @@
+""" Record and replay of the miIO traffic of Dakuo Mosquito Dispeller.
+
+A recording holds one JSON line per request in a gzip file per host:
+the command, its parameters, the round trip time and the result or the
+error of the device.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_interval
+
+from .protocol import DeviceError, DeviceException, MiioDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+# records buffered in memory before they are appended to the file, they
+# are also written every RECORD_FLUSH_INTERVAL and when Home Assistant stops
+RECORD_FLUSH_SIZE = 50
+RECORD_FLUSH_INTERVAL = timedelta(minutes=1)
+
+
+def recording_path(directory, host):
+    """Return the recording file of a host."""
+    return os.path.join(directory, "{}.jsonl.gz".format(host))
+
+
+def _write_records(path, lock, records):
+    with lock:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with gzip.open(path, "at", encoding="utf-8") as recording:
+            for record in records:
+                recording.write(json.dumps(record, separators=(",", ":")))
+                recording.write("\n")
+
+
+def _read_records(path):
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as recording:
+            return [json.loads(line) for line in recording if line.strip()]
+    except FileNotFoundError:
+        _LOGGER.warning("No recording %s to replay", path)
+        return []
+
+
+class RecordingDevice(MiioDevice):
+    """miIO client recording every request and its response."""
+
+    def __init__(self, hass: HomeAssistant, host, token, path, **kwargs):
+        """Initialize the device recording to path."""
+        super().__init__(host, token, **kwargs)
+        self._hass = hass
+        self._path = path
+        self._lock = threading.Lock()
+        self._records = []
+        self._unsub_timer = async_track_time_interval(
+            hass, self._async_flush_timer, RECORD_FLUSH_INTERVAL)
+        self._unsub_stop = hass.bus.async_listen_once(
+            EVENT_HOMEASSISTANT_STOP, self._async_stop)
+
+    async def async_send(self, command, parameters=None, retry_count=None):
+        """Send a command to the device and record the exchange."""
+        start = time.monotonic()
+        record = {
+            "cmd": command,
+            "params": parameters,
+        }
+        try:
+            record["result"] = await super().async_send(
+                command, parameters, retry_count)
+            return record["result"]
+        except DeviceError as ex:
+            record["error"] = {"code": ex.code, "message": ex.message}
+            raise
+        except DeviceException as ex:
+            record["error"] = {"message": str(ex)}
+            raise
+        finally:
+            record["ms"] = round((time.monotonic() - start) * 1000, 1)
+            self._records.append(record)
+            if len(self._records) >= RECORD_FLUSH_SIZE:
+                self._flush()
+
+    def _flush(self):
+        """Append the buffered records to the file in the executor."""
+        records, self._records = self._records, []
+        if not records:
+            return None
+        return self._hass.async_add_executor_job(
+            _write_records, self._path, self._lock, records)
+
+    @callback
+    def _async_flush_timer(self, now):
+        """Write the records buffered since the last flush."""
+        self._flush()
+
+    async def _async_stop(self, event):
+        """Write the remaining records before Home Assistant stops."""
+        self._unsub_stop = None
+        write = self._flush()
+        if write is not None:
+            await write
+
+    def close(self):
+        """Write the remaining records and close the socket."""
+        self._unsub_timer()
+        if self._unsub_stop is not None:
+            self._unsub_stop()
+            self._unsub_stop = None
+        self._flush()
+        super().close()
+
+
+class ReplayDevice(MiioDevice):
+    """miIO client answering from a recording, with the recorded timing.
+
+    The responses of each command are replayed in order and start over at
+    the end of the recording. A request with the same parameters as a
+    recorded one gets its response, others the next one of the command.
+    """
+
+    def __init__(self, host, token, records, timing=True):
+        """Initialize the device from the recorded requests."""
+        super().__init__(host, token)
+        self._timing = timing
+        self._commands = {}
+        for record in records:
+            self._commands.setdefault(record["cmd"], []).append(record)
+        self._positions = {}
+
+    @classmethod
+    async def async_load(cls, hass: HomeAssistant, host, token, path,
+                         timing=True):
+        # pylint: disable=too-many-arguments
+        """Return a device replaying the recording file of a host."""
+        records = await hass.async_add_executor_job(_read_records, path)
+        return cls(host, token, records, timing)
+
+    def _next_record(self, command, parameters):
+        records = self._commands.get(command)
+        if not records:
+            return None
+
+        position = self._positions.get(command, 0)
+        for offset in range(len(records)):
+            index = (position + offset) % len(records)
+            if records[index]["params"] == parameters:
+                break
+        else:
+            index = position % len(records)
+        self._positions[command] = index + 1
+        return records[index]
+
+    async def _async_send(self, command, parameters, retry_count):
+        """Answer a command with the next recorded response."""
+        record = self._next_record(command, parameters)
+        if record is None:
+            raise DeviceException(
+                "No recorded response to {} of {}".format(command, self.host))
+
+        if self._timing:
+            await asyncio.sleep(record.get("ms", 0) / 1000)
+        error = record.get("error")
+        if error is None:
+            return record.get("result")
+        if "code" in error:
+            raise DeviceError(error)
+        raise DeviceException(error.get("message"))
+
+    async def async_handshake(self):
+        """Do nothing, there is no device to discover."""
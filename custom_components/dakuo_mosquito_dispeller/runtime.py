@@ -0,0 +1,68 @@
+""" Runtime data of the Dakuo Mosquito Dispeller config entries."""
+
+
+class MosquitoDispellerRuntime:
+    # pylint: disable=too-few-public-methods
+    """Device handle, coordinator and entities of a loaded config entry."""
+
+    def __init__(self, entry_id, device, device_info, coordinator, options):
+        # pylint: disable=too-many-arguments
+        """Initialize the runtime data."""
+        self.entry_id = entry_id
+        self.device = device
+        self.device_info = device_info
+        self.coordinator = coordinator
+        self.options = options
+        self.entities = []
+
+    @property
+    def did(self):
+        """Return the did of the device."""
+        return self.coordinator.did
+
+    @property
+    def mac(self):
+        """Return the MAC address of the device."""
+        return self.device_info.mac_address
+
+
+class RuntimeRegistry:
+    """Runtime data of the loaded entries by entry id, did and MAC."""
+
+    def __init__(self):
+        """Initialize the registry."""
+        self._entries = {}
+        self._dids = {}
+        self._macs = {}
+
+    def get(self, entry_id):
+        """Return the runtime data of a config entry."""
+        return self._entries.get(entry_id)
+
+    def by_did(self, did):
+        """Return the runtime data of a device by its did."""
+        return self._dids.get(str(did))
+
+    def by_mac(self, mac):
+        """Return the runtime data of a device by its MAC address."""
+        return self._macs.get(mac)
+
+    def add(self, runtime):
+        """Register the runtime data of a loaded entry."""
+        self._entries[runtime.entry_id] = runtime
+        if runtime.did is not None:
+            self._dids[str(runtime.did)] = runtime
+        if runtime.mac is not None:
+            self._macs[runtime.mac] = runtime
+
+    def remove(self, entry_id):
+        """Unregister and return the runtime data of an unloaded entry."""
+        runtime = self._entries.pop(entry_id, None)
+        if runtime is None:
+            return None
+
+        for index, key in ((self._dids, str(runtime.did)),
+                           (self._macs, runtime.mac)):
+            if index.get(key) is runtime:
+                del index[key]
+        return runtime
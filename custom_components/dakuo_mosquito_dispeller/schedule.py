@@ -0,0 +1,157 @@
+""" Daily on/off schedules of Dakuo Mosquito Dispeller."""
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta
+
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_point_in_utc_time
+from homeassistant.util import dt as dt_util
+
+from .const import FLEET_CONCURRENCY, PROPERTY_MODE, PROPERTY_POWER
+from .protocol import DeviceException
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def parse_schedule(text, preset_modes):
+    """Return the (time, values) of the lines of a schedule.
+
+    Each line is "HH:MM on", "HH:MM on <preset mode>" or "HH:MM off",
+    empty lines and comments are skipped.
+    """
+    items = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        when, _, action = line.partition(" ")
+        command, _, preset_mode = action.strip().partition(" ")
+        preset_mode = preset_mode.strip()
+        try:
+            run_time = datetime.strptime(when, "%H:%M").time()
+        except ValueError as ex:
+            raise vol.Invalid("Invalid time: {}".format(line)) from ex
+
+        if command.lower() == "off" and not preset_mode:
+            values = {PROPERTY_POWER: 0}
+        elif command.lower() == "on":
+            values = {PROPERTY_POWER: 1}
+            if preset_mode:
+                if preset_mode not in preset_modes:
+                    raise vol.Invalid(
+                        "Unknown preset mode: {}".format(line))
+                values[PROPERTY_MODE] = preset_modes[preset_mode]
+        else:
+            raise vol.Invalid("Invalid action: {}".format(line))
+        items.append((run_time, values))
+
+    return items
+
+
+class ScheduleEngine:
+    """Schedules of all the dispellers, run by a single timer.
+
+    The next run of every schedule item is kept in a heap and one timer
+    waits for the earliest. The items due together are sent concurrently,
+    with one set_properties per device. Replaced schedules are dropped from
+    the heap lazily, when their items reach the top.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        """Initialize the engine."""
+        self._hass = hass
+        self._heap = []
+        self._schedules = {}
+        self._counter = itertools.count()
+        self._semaphore = asyncio.Semaphore(FLEET_CONCURRENCY)
+        self._unsub_timer = None
+        self._timer_time = None
+
+    @callback
+    def async_set(self, entry_id, coordinator, items):
+        """Set the schedule items of a device."""
+        schedule = (coordinator, items)
+        self._schedules[entry_id] = schedule
+
+        now = dt_util.now()
+        for index in range(len(items)):
+            self._push(entry_id, schedule, index, now)
+        self._async_schedule_timer()
+
+    @callback
+    def async_remove(self, entry_id):
+        """Drop the schedule of a device."""
+        if self._schedules.pop(entry_id, None) is not None:
+            self._async_schedule_timer()
+
+    def _push(self, entry_id, schedule, index, now):
+        """Add the next run of a schedule item to the heap."""
+        run_time = schedule[1][index][0]
+        run = now.replace(hour=run_time.hour, minute=run_time.minute,
+                          second=0, microsecond=0)
+        if run <= now:
+            run += timedelta(days=1)
+        heapq.heappush(self._heap, (
+            dt_util.as_utc(run), next(self._counter), entry_id, schedule,
+            index))
+
+    def _is_current(self, item):
+        return self._schedules.get(item[2]) is item[3]
+
+    @callback
+    def _async_schedule_timer(self):
+        """Wait for the earliest item of the heap."""
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+
+        when = self._heap[0][0] if self._heap else None
+        if when == self._timer_time:
+            return
+
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+        self._timer_time = when
+        if when is not None:
+            self._unsub_timer = async_track_point_in_utc_time(
+                self._hass, self._async_run, when)
+
+    async def _async_run(self, now):
+        """Send the commands of the due items and wait for the next ones."""
+        self._unsub_timer = None
+        self._timer_time = None
+
+        commands = {}
+        local_now = dt_util.as_local(now)
+        while self._heap and self._heap[0][0] <= now:
+            item = heapq.heappop(self._heap)
+            if not self._is_current(item):
+                continue
+            _, _, entry_id, schedule, index = item
+            coordinator, items = schedule
+            commands.setdefault(entry_id, (coordinator, {}))[1].update(
+                items[index][1])
+            self._push(entry_id, schedule, index, local_now)
+        self._async_schedule_timer()
+
+        _LOGGER.debug("Running the schedule of %d devices", len(commands))
+        await asyncio.gather(*[
+            self._async_command(coordinator, values)
+            for coordinator, values in commands.values()
+        ])
+
+    async def _async_command(self, coordinator, values):
+        """Send the scheduled values to a device."""
+        async with self._semaphore:
+            try:
+                await coordinator.async_set_properties(values)
+            except DeviceException as ex:
+                _LOGGER.warning(
+                    "Scheduled command of %s failed: %s", coordinator.name, ex)
+                return
+
+        coordinator.async_command_sent()
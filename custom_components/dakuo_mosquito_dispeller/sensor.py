@@ -1,20 +1,19 @@
 """ Dakuo Mosquito Dispeller Sensor integration."""
 import logging
-from functools import partial
 
-from miio import Device, DeviceException
 from homeassistant.const import (
-    CONF_HOST,
-    CONF_TOKEN,
-    PERCENTAGE
+    PERCENTAGE,
+    UnitOfTime
 )
 from homeassistant.components.sensor import SensorEntity
-from homeassistant.exceptions import PlatformNotReady
+from homeassistant.core import callback
+from homeassistant.helpers.entity import EntityCategory
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from .const import (
     ATTR_MODEL,
     DOMAIN,
     MANUFACTURER,
-    MOSQUITO_DISPELLER_DATA
+    PROPERTY_LIQUID_LEFT
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -23,54 +22,76 @@ _LOGGER = logging.getLogger(__name__)
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Set up the Mosquito Dispeller Sensor from a config entry."""
 
-    if MOSQUITO_DISPELLER_DATA not in hass.data:
-        hass.data[MOSQUITO_DISPELLER_DATA] = {}
-
-    if config_entry.data.get(CONF_HOST, None):
-        host = config_entry.data[CONF_HOST]
-        token = config_entry.data[CONF_TOKEN]
-    else:
-        host = config_entry.options[CONF_HOST]
-        token = config_entry.options[CONF_TOKEN]
-
+    runtime = hass.data[DOMAIN].get(config_entry.entry_id)
+    device_info = runtime.device_info
     name = config_entry.title
-
-    _LOGGER.debug("Initializing with host %s (token %s...)", host, token[:5])
-    unique_id = None
-
-    try:
-        miio_device = Device(host, token)
-        device_info = miio_device.info()
-        if device_info.model:
-            model = device_info.model
-        miio_uid = device_info.raw['uid']
-        unique_id = "sensor-{}".format(device_info.mac_address)
-    except DeviceException as ex:
-        raise PlatformNotReady
-
-    device = MosquitoDispellerSensor(
-        "{} Liquid Left ".format(
-            name[:-5]), miio_device, model, unique_id, miio_uid)
-    hass.data[MOSQUITO_DISPELLER_DATA][host] = device
-    async_add_entities([device], update_before_add=True)
-
-
-class MosquitoDispellerSensor(SensorEntity):
+    unique_id = "sensor-{}".format(device_info.mac_address)
+    sensors = []
+
+    # only the models reporting the liquid level get the liquid sensors
+    if PROPERTY_LIQUID_LEFT in runtime.coordinator.profile.properties:
+        sensors += [
+            MosquitoDispellerSensor(
+                runtime.coordinator,
+                "{} Liquid Left ".format(name[:-5]),
+                runtime.device,
+                device_info,
+                unique_id
+            ),
+            MosquitoDispellerConsumptionSensor(
+                runtime.coordinator,
+                "{} Liquid Consumption ".format(name[:-5]),
+                runtime.device,
+                device_info,
+                "sensor-consumption-{}".format(device_info.mac_address)
+            ),
+            MosquitoDispellerTimeToEmptySensor(
+                runtime.coordinator,
+                "{} Liquid Time To Empty ".format(name[:-5]),
+                runtime.device,
+                device_info,
+                "sensor-time-to-empty-{}".format(device_info.mac_address)
+            )
+        ]
+
+    sensors += [
+        MosquitoDispellerLatencySensor(
+            runtime.coordinator,
+            "{} Round Trip Time ".format(name[:-5]),
+            runtime.device,
+            device_info,
+            "sensor-latency-{}".format(device_info.mac_address)
+        ),
+        MosquitoDispellerFailuresSensor(
+            runtime.coordinator,
+            "{} Failed Requests ".format(name[:-5]),
+            runtime.device,
+            device_info,
+            "sensor-failures-{}".format(device_info.mac_address)
+        )
+    ]
+    runtime.entities.extend(sensors)
+    async_add_entities(sensors)
+
+
+class MosquitoDispellerSensor(CoordinatorEntity, SensorEntity):
     """Representation of a Mosquito Dispeller Sensor."""
 
-    def __init__(self, name, device, model, unique_id, miio_uid):
+    def __init__(self, coordinator, name, device, device_info, unique_id):
+        # pylint: disable=too-many-arguments
         """Initialize the Mosquito Dispeller Sensor."""
-        super().__init__()
-        self._model = model
+        super().__init__(coordinator)
+        self._model = device_info.model
         self._unique_id = unique_id
         self._device = device
         self._name = name
-        self._skip_update = False
-        self._did = miio_uid
+        self._did = coordinator.did or device_info.mac_address
         self._available = False
         self._state = None
         self._state_attrs = {ATTR_MODEL: self._model}
-        self._device_info = device.info()
+        self._written = None
+        self._device_info = device_info
+        self._update_state()
 
     @property
     def name(self):
@@ -111,58 +132,123 @@ class MosquitoDispellerSensor(SensorEntity):
             "identifiers": {(DOMAIN, self._did)}
         }
 
-    async def _try_command(self, mask_error, func, *args, **kwargs):
-        """Call a vacuum command handling error messages."""
-        try:
-            await self.hass.async_add_executor_job(partial(
-                func, *args, **kwargs))
-            return True
-        except DeviceException as ex:
-            _LOGGER.error(mask_error, ex)
-            return False
+    def _update_state(self):
+        """Update the sensor state from the coordinator data."""
+        data = self.coordinator.data or {}
+        self._state = data.get(PROPERTY_LIQUID_LEFT)
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Handle updated data from the coordinator."""
+        # compared with the last written state, available already follows
+        # the last_update_success of the coordinator
+        self._update_state()
+        state = (self.available, self._state)
+        if state != self._written:
+            self._written = state
+            super()._handle_coordinator_update()
+
+
+class MosquitoDispellerConsumptionSensor(MosquitoDispellerSensor):
+    """Liquid consumption rate estimated from the level history."""
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement."""
+        return "%/h"
+
+    def _update_state(self):
+        """Update the sensor state from the liquid history."""
+        rate = self.coordinator.liquid.rate
+        self._state = round(rate, 2) if rate is not None else None
+
+
+class MosquitoDispellerTimeToEmptySensor(MosquitoDispellerSensor):
+    """Estimated time until the liquid runs out."""
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement."""
+        return UnitOfTime.HOURS
+
+    @property
+    def device_class(self):
+        """The type of sensor"""
+        return "duration"
+
+    def _update_state(self):
+        """Update the sensor state from the liquid history."""
+        hours = self.coordinator.liquid.time_to_empty
+        self._state = round(hours, 1) if hours is not None else None
+
+
+class MosquitoDispellerDiagnosticSensor(MosquitoDispellerSensor):
+    """Transport statistics of the device, disabled by default.
+
+    The statistics change on every request while the coordinator only
+    notifies property changes, so these sensors are polled.
+    """
+
+    @property
+    def should_poll(self):
+        """Return true, the statistics are read periodically."""
+        return True
 
     async def async_update(self):
-        """Fetch state from the device."""
-
-        # On state change the device doesn't provide the new state immediately.
-        if self._skip_update:
-            self._skip_update = False
-            return
-
-        try:
-            if self._did is None:
-                status = await self.hass.async_add_job(
-                    self._device.raw_command,
-                    "get_properties",
-                    [{"piid": 3, "siid": 1, "did": str(self._did)}]
-                )
-                if status[0]['code'] == 0:
-                    self._did = status[0]['value']
-                else:
-                    self._did = self._unique_id
-
-            self._available = True
-        except DeviceException as ex:
-            self._available = False
-            _LOGGER.error(
-                "Got exception while fetching the state: %s",
-                ex
-            )
-            return
+        """Read the statistics without refreshing the coordinator."""
+        self._update_state()
 
-        try:
-            status = await self.hass.async_add_job(
-                self._device.raw_command,
-                "get_properties",
-                [{"piid": 1, "siid": 5, "did": str(self._did)}]
-            )
-            _LOGGER.info("Got new status: %s", status)
+    @property
+    def entity_category(self):
+        """Return the category of the entity."""
+        return EntityCategory.DIAGNOSTIC
+
+    @property
+    def entity_registry_enabled_default(self):
+        """Return if the entity should be enabled when first added."""
+        return False
 
-            self._available = False
-            if status[0]['code'] == 0:
-                self._state = status[0]['value']
-                self._available = True
-        except DeviceException as ex:
-            # If get exception while getting liquid-left, it means liquid left 0.
-            self._state = 0
+    @property
+    def available(self):
+        """Return true, the statistics are known while offline."""
+        return True
+
+
+class MosquitoDispellerLatencySensor(MosquitoDispellerDiagnosticSensor):
+    """95th percentile of the poll round trip time."""
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement."""
+        return UnitOfTime.MILLISECONDS
 
+    def _update_state(self):
+        """Update the sensor state from the transport statistics."""
+        latency = self._device.stats.command("get_properties").percentile(95)
+        self._state = round(latency * 1000) if latency is not None else None
+
+    @property
+    def extra_state_attributes(self):
+        """Return the percentiles of the poll round trip time."""
+        return self._device.stats.command("get_properties").as_dict()
+
+
+class MosquitoDispellerFailuresSensor(MosquitoDispellerDiagnosticSensor):
+    """Number of failed requests to the device."""
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement."""
+        return None
+
+    def _update_state(self):
+        """Update the sensor state from the transport statistics."""
+        self._state = self._device.stats.failures
+
+    @property
+    def extra_state_attributes(self):
+        """Return the last error of the device."""
+        return {
+            "last_error": self._device.stats.last_error,
+            "last_error_time": self._device.stats.last_error_time
+        }
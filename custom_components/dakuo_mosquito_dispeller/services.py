@@ -0,0 +1,120 @@
+""" Services of the Dakuo Mosquito Dispeller integration."""
+import asyncio
+import logging
+
+import voluptuous as vol
+from homeassistant.components.fan import ATTR_PRESET_MODE
+from homeassistant.const import ATTR_AREA_ID, ATTR_DEVICE_ID
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse
+from homeassistant.helpers import device_registry as dr
+import homeassistant.helpers.config_validation as cv
+
+from .const import (
+    ATTR_POWER,
+    DOMAIN,
+    FLEET_CONCURRENCY,
+    PROPERTY_MODE,
+    PROPERTY_POWER,
+    SERVICE_SET_FLEET
+)
+from .protocol import DeviceException
+
+_LOGGER = logging.getLogger(__name__)
+
+SET_FLEET_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Optional(ATTR_DEVICE_ID, default=[]): cv.ensure_list,
+            vol.Optional(ATTR_AREA_ID, default=[]): cv.ensure_list,
+            vol.Optional(ATTR_POWER): cv.boolean,
+            vol.Optional(ATTR_PRESET_MODE): cv.string,
+        }
+    ),
+    cv.has_at_least_one_key(ATTR_POWER, ATTR_PRESET_MODE),
+)
+
+
+def _fleet_devices(hass: HomeAssistant, call: ServiceCall):
+    """Return the device registry entries targeted by a service call."""
+    registry = dr.async_get(hass)
+    devices = {}
+
+    for device_id in call.data[ATTR_DEVICE_ID]:
+        device = registry.async_get(device_id)
+        if device is not None:
+            devices[device.id] = device
+    for area_id in call.data[ATTR_AREA_ID]:
+        for device in dr.async_entries_for_area(registry, area_id):
+            devices[device.id] = device
+
+    return [
+        device for device in devices.values()
+        if any(domain == DOMAIN for domain, _ in device.identifiers)
+    ]
+
+
+def _device_coordinator(hass: HomeAssistant, device):
+    """Return the coordinator of a device registry entry."""
+    runtimes = hass.data[DOMAIN]
+    for domain, identifier in device.identifiers:
+        if domain != DOMAIN:
+            continue
+        # the devices are identified by did, or MAC before the first poll
+        runtime = runtimes.by_did(identifier) or runtimes.by_mac(identifier)
+        if runtime is not None:
+            return runtime.coordinator
+    return None
+
+
+async def async_setup_services(hass: HomeAssistant):
+    """Register the services of the integration."""
+
+    semaphore = asyncio.Semaphore(FLEET_CONCURRENCY)
+
+    async def _async_command(device, data):
+        """Command one device of the fleet."""
+        coordinator = _device_coordinator(hass, device)
+        if coordinator is None:
+            return {"success": False, "error": "Device is not loaded"}
+
+        values = {}
+        if ATTR_POWER in data:
+            values[PROPERTY_POWER] = int(data[ATTR_POWER])
+        if ATTR_PRESET_MODE in data:
+            preset_modes = coordinator.profile.preset_modes
+            if data[ATTR_PRESET_MODE] not in preset_modes:
+                return {"success": False, "error": "Unsupported preset mode"}
+            values[PROPERTY_MODE] = preset_modes[data[ATTR_PRESET_MODE]]
+
+        async with semaphore:
+            try:
+                result = await coordinator.async_set_properties(values)
+            except DeviceException as ex:
+                _LOGGER.warning(
+                    "Setting fleet device %s failed: %s", device.name, ex)
+                return {"success": False, "error": str(ex)}
+
+        coordinator.async_command_sent()
+        success = isinstance(result, list) and all(
+            item.get("code") == 0 for item in result)
+        return {"success": success, "result": result}
+
+    async def async_set_fleet(call: ServiceCall):
+        """Command many dispellers concurrently."""
+        devices = _fleet_devices(hass, call)
+        results = await asyncio.gather(
+            *[_async_command(device, call.data) for device in devices])
+
+        return {
+            "devices": {
+                device.id: result for device, result in zip(devices, results)
+            }
+        }
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_SET_FLEET,
+        async_set_fleet,
+        schema=SET_FLEET_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL
+    )